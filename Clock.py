@@ -0,0 +1,13 @@
+"""
+The clocks the script measures intervals with, shared by the modules that
+rate limit, coalesce, accelerate, time or timestamp. Live's Python 2 lacks
+time.monotonic and time.perf_counter, so time.time is used there instead.
+
+monotonic_clock is for intervals of seconds and more. precise_clock is for
+intervals of milliseconds, like those between two encoder detents, as
+time.monotonic only ticks every ~16 ms on Windows.
+"""
+import time
+
+monotonic_clock = getattr(time, 'monotonic', time.time)
+precise_clock = getattr(time, 'perf_counter', time.time)
@@ -0,0 +1,177 @@
+from Clock import monotonic_clock, precise_clock
+
+
+class ParameterCoalescer(object):
+    """
+    Coalesces floods of writes to Live parameters, keeping only the latest
+    value per parameter and writing it once per tick on flush().
+
+    Every fader or knob drives exactly one parameter, so keying by parameter
+    is keying by control. With write_first_immediately, the first value from
+    a control that was idle during the previous tick is written right away so
+    the control still feels responsive; the rest of the burst is coalesced.
+
+    The last value written to every parameter is kept, and a value equal to
+    it is not written again, e.g. while an EQ knob turns through the dead
+    zone of its curve. A parameter changed from Live in the meantime is
+    written again as soon as the control moves to another value.
+    """
+    def __init__(self, write_first_immediately=True):
+        self.write_first_immediately = write_first_immediately
+        self._pending = {}
+        self._active = {}
+        self._written = {}
+        self.received_count = 0
+        self.write_count = 0
+
+    @property
+    def saved_count(self):
+        """ Number of values that were coalesced instead of written to Live """
+        return self.received_count - self.write_count - len(self._pending)
+
+    def set_value(self, parameter, value):
+        """
+        Request a parameter to be set, either now or on the next flush.
+
+        parameter: the Live DeviceParameter to write
+        value:     the new parameter value
+        """
+        self.received_count += 1
+        if (parameter not in self._pending and
+                self._written.get(parameter) == value):
+            return
+        if self.write_first_immediately and parameter not in self._active:
+            self._active[parameter] = value
+            self._written[parameter] = value
+            self.write_count += 1
+            parameter.value = value
+        else:
+            self._pending[parameter] = value
+
+    def flush(self):
+        """
+        Write the latest pending value of every parameter, skipping those
+        already written with that value.
+        """
+        written = self._written
+        self._active = self._pending
+        self._pending = {}
+        for parameter, value in self._active.items():
+            if written.get(parameter) != value:
+                written[parameter] = value
+                self.write_count += 1
+                parameter.value = value
+
+    def discard(self, parameter):
+        """ Drop any pending value for a parameter that is no longer bound. """
+        self._pending.pop(parameter, None)
+        self._active.pop(parameter, None)
+        self._written.pop(parameter, None)
+
+
+class SoftTakeover(object):
+    """
+    Ignores the values of a fader or knob until they reach or cross the
+    current value of its parameter, so that a newly bound parameter doesn't
+    jump to wherever the control happens to be.
+
+    Every control drives exactly one parameter, so parameters are tracked
+    instead of controls. A parameter is picked up once, and waits again
+    after being discarded when its control is bound to another one. A
+    parameter outside the range of the control's curve, e.g. an EQ Eight
+    gain above +6 dB, is picked up at the nearest end of the curve.
+    """
+    def __init__(self):
+        self._picked_up = set()
+        self._last_values = {}
+        # id of a curve table -> (table, lowest, highest), the table is kept
+        # so its id isn't reused by another one
+        self._curve_ranges = {}
+        self.ignored_count = 0
+
+    def accept(self, parameter, value, curve=None):
+        """
+        Returns True if a value of the control of a parameter should be
+        written, picking up the parameter if the control reached it.
+
+        parameter: the Live DeviceParameter the control drives
+        value:     the value the control position maps to
+        curve:     the curve table the value is from, None if unbounded
+        """
+        if parameter in self._picked_up:
+            return True
+        current = parameter.value
+        if curve is not None:
+            curve_range = self._curve_ranges.get(id(curve))
+            if curve_range is None or curve_range[0] is not curve:
+                curve_range = (curve, min(curve), max(curve))
+                self._curve_ranges[id(curve)] = curve_range
+            current = min(max(current, curve_range[1]), curve_range[2])
+        last_value = self._last_values.get(parameter)
+        if value == current or (last_value is not None and
+                                (last_value < current) != (value < current)):
+            self._picked_up.add(parameter)
+            self._last_values.pop(parameter, None)
+            return True
+        self._last_values[parameter] = value
+        self.ignored_count += 1
+        return False
+
+    def discard(self, parameter):
+        """ Forget a parameter that is no longer bound to its control. """
+        self._picked_up.discard(parameter)
+        self._last_values.pop(parameter, None)
+
+
+class DetentAccumulator(object):
+    """
+    Accumulates the detents of a relative encoder into a single delta that
+    is taken once per tick.
+
+    Detents arriving less than `slow_interval` seconds apart are accelerated:
+    the step is multiplied by how many times faster than slow_interval they
+    came, up to `max_acceleration`. Slow turns keep the exact step size, and
+    a change of direction always starts over without acceleration. Detents
+    too close for the clock to tell apart are taken to be as far apart as
+    the previous two, rather than infinitely fast.
+    """
+    def __init__(self, slow_interval=0.04, max_acceleration=10,
+                 clock=precise_clock):
+        self.slow_interval = slow_interval
+        self.max_acceleration = max_acceleration
+        self._clock = clock
+        self._last_detent_time = None
+        self._last_interval = None
+        self._last_direction = 0
+        self.delta = 0.0
+        self.detent_count = 0
+
+    def add_detent(self, step):
+        """
+        Add one encoder detent.
+
+        step: signed change for a single unaccelerated detent
+        """
+        now = self._clock()
+        direction = 1 if step > 0 else -1
+        multiplier = 1
+        interval = None
+        if (direction == self._last_direction and
+                self._last_detent_time is not None):
+            interval = now - self._last_detent_time
+            if interval <= 0:
+                interval = self._last_interval
+        if interval is not None and interval < self.slow_interval:
+            multiplier = min(self.max_acceleration,
+                             int(self.slow_interval / interval))
+        self._last_interval = interval
+        self._last_detent_time = now
+        self._last_direction = direction
+        self.delta += step * multiplier
+        self.detent_count += 1
+
+    def take(self):
+        """ Returns the accumulated delta and resets it to zero. """
+        delta = self.delta
+        self.delta = 0.0
+        return delta
@@ -0,0 +1,142 @@
+"""
+Loads the control mapping of a K2 unit from a data file (see
+XoneK2Mapping.txt) and compiles it into note and CC numbers and LED ids per
+role, indexed by channel strip.
+
+Compiling means parsing every line and resolving the LED names through
+LedTable, so the compiled form is cached on disk with the CRC-32 and size
+of the mapping file, and later loads of an unchanged file only read the
+cache. (A CRC is plenty to notice an edit, and unlike hashlib it costs
+nothing to import.)
+"""
+import marshal
+import zlib
+
+from LedTable import led_id
+
+CACHE_FORMAT = 1 # bump when the compiled form changes
+KINDS = ('button', 'fader', 'knob', 'encoder')
+UNIT_SLOT = '-'
+
+
+class ControlMapping(object):
+    """
+    Compiled control mapping, by role.
+
+    roles: dict of role name to a (kind, is strip role, numbers, LED ids)
+           tuple, where numbers and LED ids are indexed by channel strip, or
+           have a single entry for a role of the whole unit. LED ids is None
+           for a role without LEDs.
+    """
+    def __init__(self, roles):
+        self.roles = roles
+
+    def _role(self, role):
+        try:
+            return self.roles[role]
+        except KeyError:
+            raise ValueError('The control mapping has no %r role' % role)
+
+    def kind(self, role):
+        """ Returns the kind of the controls of a role, e.g. 'button'. """
+        return self._role(role)[0]
+
+    def is_strip_role(self, role):
+        """ Returns True if the role has a control per channel strip. """
+        return self._role(role)[1]
+
+    def numbers(self, role):
+        """ Returns the note or CC numbers of a role, by channel strip. """
+        return self._role(role)[2]
+
+    def leds(self, role):
+        """ Returns the LED ids of a role by channel strip, or None. """
+        return self._role(role)[3]
+
+
+def compile_mapping(text, path='<mapping>'):
+    """
+    Compile the text of a mapping file into the roles of a ControlMapping.
+
+    text: contents of the mapping file
+    path: name of the file, for error messages
+    """
+    controls = {}
+    for line_num, line in enumerate(text.splitlines(), 1):
+        fields = line.split('#', 1)[0].split()
+        if not fields:
+            continue
+        try:
+            if len(fields) not in (4, 6):
+                raise ValueError('expected kind, number, role, slot and '
+                                 'optionally a LED element and color')
+            kind, number, role, slot = fields[:4]
+            if kind not in KINDS:
+                raise ValueError('unknown kind %r' % kind)
+            number = int(number, 0)
+            if not 0 <= number <= 127:
+                raise ValueError('number %d out of range' % number)
+            slot = None if slot == UNIT_SLOT else int(slot)
+            led = None
+            if len(fields) == 6:
+                try:
+                    led = led_id(fields[4], fields[5])
+                except KeyError:
+                    raise ValueError('unknown LED %s %s' % tuple(fields[4:]))
+            controls.setdefault(role, []).append((slot, kind, number, led))
+        except ValueError as error:
+            raise ValueError('%s:%d: %s' % (path, line_num, error))
+    roles = {}
+    for role, role_controls in controls.items():
+        role_controls.sort(key=lambda control: (control[0] is not None,
+                                                control[0]))
+        slots = [control[0] for control in role_controls]
+        kinds = set(control[1] for control in role_controls)
+        leds = [control[3] for control in role_controls]
+        is_strip_role = slots != [None]
+        if is_strip_role and slots != list(range(len(slots))):
+            raise ValueError('%s: role %r needs one control per slot from 0, '
+                             'or a single control with slot -' % (path, role))
+        if len(kinds) != 1:
+            raise ValueError('%s: role %r mixes kinds of controls'
+                             % (path, role))
+        if None in leds:
+            if leds.count(None) != len(leds):
+                raise ValueError('%s: role %r has LEDs on only some slots'
+                                 % (path, role))
+            leds = None
+        else:
+            leds = tuple(leds)
+        roles[role] = (kinds.pop(), is_strip_role,
+                       tuple(control[2] for control in role_controls), leds)
+    return roles
+
+
+def load_mapping(path, cache_path=None):
+    """
+    Load a mapping file, from the compiled cache if the file is unchanged.
+
+    path:       the mapping file
+    cache_path: file to cache the compiled mapping in, or None to always
+                compile. The cache is rewritten when the mapping changes,
+                and ignored if it can't be read or written.
+    """
+    with open(path, 'rb') as mapping_file:
+        data = mapping_file.read()
+    digest = (zlib.crc32(data) & 0xFFFFFFFF, len(data))
+    if cache_path is not None:
+        try:
+            with open(cache_path, 'rb') as cache_file:
+                cache_format, cache_digest, roles = marshal.load(cache_file)
+            if cache_format == CACHE_FORMAT and cache_digest == digest:
+                return ControlMapping(roles)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            pass
+    roles = compile_mapping(data.decode('utf-8'), path)
+    if cache_path is not None:
+        try:
+            with open(cache_path, 'wb') as cache_file:
+                marshal.dump((CACHE_FORMAT, digest, roles), cache_file)
+        except (IOError, OSError):
+            pass
+    return ControlMapping(roles)
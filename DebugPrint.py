@@ -1,19 +1,149 @@
+from Clock import monotonic_clock as _clock
+
 _c_instance = None
 
+# Log levels
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING',
+               ERROR: 'ERROR'}
+
+BUFFER_SIZE = 256 # messages kept between two flushes, older ones are dropped
+RATE_LIMIT_INTERVAL = 1.0 # seconds a repeated message is suppressed for
+
+try:
+    _string_types = (str, unicode)
+except NameError:
+    _string_types = (str,)
+_level = INFO
+_buffer = [None] * BUFFER_SIZE
+_head = 0 # index of the oldest buffered message
+_count = 0 # number of buffered messages
+_dropped = 0
+# (message, args) -> [time logged, repeats suppressed since], where args is
+# None for messages whose args can't be hashed, which are limited by format
+_last_logged = {}
+
 def set_c_instance(c_instance):
     ''' Store a ref to the controller instance '''
     c_instance.log_message("set_c_instance called")
     global _c_instance
     _c_instance = c_instance
 
-def log_message(*args, **kwargs):
+def set_level(level):
+    ''' Set the lowest level of messages that are logged '''
+    global _level
+    _level = level
+
+def is_enabled_for(level):
+    ''' Returns True if messages of the level are logged '''
+    return level >= _level
+
+def log(level, message, *args):
+    '''
+    Buffer a message to be written to Live's log on the next flush.
+
+    The message is only formatted with the args (message % args) when it is
+    flushed, and it is dropped right away if its level is disabled or the
+    same message with the same args was logged less than RATE_LIMIT_INTERVAL
+    seconds ago, so a repeating log call in a handler logs at most once a
+    second. Messages with args that can't be hashed are limited by their
+    format alone. If more than BUFFER_SIZE messages are logged between two
+    flushes, the oldest are dropped, so logging never blocks the caller.
+
+    message: format string, or any other object to log as a string
+    '''
+    global _head, _count, _dropped
+    if level < _level:
+        return
+    if not isinstance(message, _string_types):
+        message = str(message)
+    now = _clock()
+    key = (message, args)
+    try:
+        last = _last_logged.get(key)
+    except TypeError:
+        key = (message, None)
+        last = _last_logged.get(key)
+    if last is not None and now - last[0] < RATE_LIMIT_INTERVAL:
+        last[1] += 1
+        return
+    _last_logged[key] = [now, 0]
+    if _count == BUFFER_SIZE:
+        _head = (_head + 1) % BUFFER_SIZE
+        _count -= 1
+        _dropped += 1
+    _buffer[(_head + _count) % BUFFER_SIZE] = (level, message, args)
+    _count += 1
+
+def debug(message, *args):
+    log(DEBUG, message, *args)
+
+def info(message, *args):
+    log(INFO, message, *args)
+
+def warning(message, *args):
+    log(WARNING, message, *args)
+
+def error(message, *args):
+    log(ERROR, message, *args)
+
+def log_message(message, *args):
     ''' Print a debug message via the stored controller instance '''
-    _c_instance.log_message(*args, **kwargs)
+    log(INFO, message, *args)
+
+def flush():
+    '''
+    Write the buffered messages to Live's log, along with how many were
+    dropped or suppressed as repeats. Called once per display tick.
+    '''
+    global _head, _count, _dropped
+    if _c_instance is None:
+        return
+    write = _c_instance.log_message
+    if _dropped:
+        write('WARNING: %d log messages dropped' % _dropped)
+        _dropped = 0
+    while _count:
+        level, message, args = _buffer[_head]
+        _buffer[_head] = None
+        _head = (_head + 1) % BUFFER_SIZE
+        _count -= 1
+        write('%s: %s' % (LEVEL_NAMES.get(level, level),
+                          _format(message, args)))
+    now = _clock()
+    for key, last in list(_last_logged.items()):
+        if now - last[0] >= RATE_LIMIT_INTERVAL:
+            del _last_logged[key]
+            message, args = key
+            if not last[1]:
+                continue
+            if args is None:
+                write('%d similar messages suppressed: %s'
+                      % (last[1], message))
+            else:
+                write('Last message repeated %d times: %s'
+                      % (last[1], _format(message, args)))
+
+def _format(message, args):
+    '''
+    Returns message % args, or the message and the args as they are if
+    formatting fails, e.g. because the repr of a deleted Live object raises.
+    '''
+    if not args:
+        return message
+    try:
+        return message % args
+    except Exception:
+        try:
+            return '%s %r' % (message, args)
+        except Exception:
+            return '%s <args not printable>' % message
 
 # https://stackoverflow.com/a/192184
 def dump_object(obj):
     ''' Dump all attributes in obj and return as newline separated strings. '''
-    s = ""
-    for attr in dir(obj):
-        s = s + "\nobj.%s = %r" % (attr, getattr(obj, attr))
-    return
+    return ''.join("\nobj.%s = %r" % (attr, getattr(obj, attr))
+                   for attr in dir(obj))
@@ -0,0 +1,160 @@
+"""
+Profiles of the Live devices the EQ controls of a channel strip can drive,
+keyed by the class_name of the device, so a device is still found after the
+user renames it.
+
+A profile names the parameter of the device for every role of the EQ
+controls, in the order of ROLES, or None for a role the device lacks:
+
+    kill                         switch turning the whole device off
+    hi_cut, mid_cut, low_cut     switches turning a band off
+    hi_gain, mid_gain, low_gain  gains of the bands
+
+Switches are on at 1.0 and off at 0.0. The EQ knob curve is in the units of
+the EQ Three gains (see ResponseCurves), and is scaled to the range of the
+gain parameters of other devices.
+"""
+from ResponseCurves import NORMALIZED_ZERO_DB
+
+ROLES = ('kill', 'hi_cut', 'mid_cut', 'low_cut',
+         'hi_gain', 'mid_gain', 'low_gain')
+
+# Parameter name to index maps, per device class_name, of the last device
+# of the class in which all the requested names were found
+_parameter_indexes = {}
+
+
+class DeviceProfile(object):
+    """
+    The parameters of a kind of device the EQ controls can drive.
+
+    class_name:      the class_name of the devices, as given by Live
+    parameter_names: parameter name per role of ROLES, or None
+    gain_range:      (lowest, 0 dB, highest) value of the gain parameters,
+                     or None if they are in the units of EQ Three's gains
+
+    A device only matches its profile if all the named parameters are
+    found, e.g. a rack without the expected macros doesn't match.
+    """
+    def __init__(self, class_name, parameter_names, gain_range=None):
+        if len(parameter_names) != len(ROLES):
+            raise ValueError('A device profile needs a parameter per role')
+        self.class_name = class_name
+        self.parameter_names = tuple(parameter_names)
+        self.gain_range = gain_range
+        self._curve = None
+        self._gain_curve = None
+
+    def scale_gain(self, value):
+        """
+        Scale a value of the EQ knob curve to the range of the gains.
+
+        value: gain in the units of EQ Three, NORMALIZED_ZERO_DB is 0 dB
+        """
+        lowest, zero_db, highest = self.gain_range
+        if value <= NORMALIZED_ZERO_DB:
+            return lowest + (zero_db - lowest) * value / NORMALIZED_ZERO_DB
+        return zero_db + ((highest - zero_db) * (value - NORMALIZED_ZERO_DB) /
+                          (1.0 - NORMALIZED_ZERO_DB))
+
+    def gain_curve(self, curve):
+        """
+        Returns an EQ knob curve table scaled to the range of the gains. The
+        table of the last curve is cached, so every strip bound to a device
+        of the profile shares it.
+
+        curve: 128 gain values in the units of EQ Three, by CC value
+        """
+        if self.gain_range is None:
+            return curve
+        if curve is not self._curve:
+            self._gain_curve = tuple(self.scale_gain(value)
+                                     for value in curve)
+            self._curve = curve
+        return self._gain_curve
+
+
+# Device profiles, the most preferred first when a track has several
+PROFILES = [
+    DeviceProfile('FilterEQ3', (
+        'Device On', 'HighOn', 'MidOn', 'LowOn',
+        'GainHi', 'GainMid', 'GainLo')),
+    # The highest, a middle and the lowest band, with the gains reaching
+    # +6 dB at full twist right like EQ Three. Turning a band filter of EQ
+    # Eight off makes the band flat instead of killing it like EQ Three's
+    # band switches, so the bands have no cuts.
+    DeviceProfile('Eq8', (
+        'Device On', None, None, None,
+        '8 Gain A', '4 Gain A', '1 Gain A'), (-15.0, 0.0, 6.0)),
+    # Audio effect racks with macros named High, Mid and Low, like DJ style
+    # filter and EQ racks, with 0 dB at the center of the macros
+    DeviceProfile('AudioEffectGroupDevice', (
+        'Device On', None, None, None, 'High', 'Mid', 'Low'),
+        (0.0, 63.5, 127.0)),
+]
+_profile_ranks = dict((profile.class_name, (rank, profile))
+                      for rank, profile in enumerate(PROFILES))
+
+
+def find_eq_device(devices):
+    """
+    Find the device with the most preferred profile in a device chain, in a
+    single pass. Of several devices with the same profile the first wins.
+
+    devices: the devices of a track
+    Returns a (device, profile, parameters by role) tuple, or
+    (None, None, None) if no device matches a profile.
+    """
+    best = (None, None, None)
+    best_rank = len(PROFILES)
+    for device in devices:
+        rank, profile = _profile_ranks.get(device.class_name, (None, None))
+        if profile is None or rank >= best_rank:
+            continue
+        names = profile.parameter_names
+        parameters = get_device_parameters(device, names)
+        if any(param is None and name is not None
+               for param, name in zip(parameters, names)):
+            continue
+        best = (device, profile, parameters)
+        best_rank = rank
+        if rank == 0:
+            break
+    return best
+
+
+def get_device_parameters(device, param_names):
+    """
+    Finds several parameters of a device by name, in a single pass.
+
+    The indexes of the parameters of the last device of a class in which
+    all the names were found are cached, so only the names at the cached
+    indexes are checked for the next device of the class. Devices with a
+    different parameter layout, like racks with other macros or plugins,
+    fall back to a full scan, and a device in which all the names are
+    found by the scan replaces the cached layout.
+
+    device: Device.Device instance to inspect
+    param_names: names of the parameters to find, None to skip a name
+    Returns a list with a DeviceParameter, or None if not found, per name.
+    """
+    parameters = device.parameters
+    indexes = _parameter_indexes.get(device.class_name)
+    if indexes is not None:
+        found = []
+        for name in param_names:
+            if name is None:
+                found.append(None)
+                continue
+            i = indexes.get(name)
+            if (i is None or i >= len(parameters) or
+                    parameters[i].name != name):
+                break
+            found.append(parameters[i])
+        else:
+            return found
+    indexes = dict((param.name, i) for i, param in enumerate(parameters))
+    if all(name is None or name in indexes for name in param_names):
+        _parameter_indexes[device.class_name] = indexes
+    return [None if name is None or name not in indexes
+            else parameters[indexes[name]] for name in param_names]
@@ -0,0 +1,131 @@
+"""
+Opt-in timing and counters for the handlers of the script.
+
+Handlers are wrapped once, when the script is constructed with
+INSTRUMENTATION enabled, so an uninstrumented script runs its plain bound
+methods without any extra cost. Every handler has a fixed list of counters,
+allocated up front:
+
+    calls, total seconds, max seconds, Live writes, LED requests,
+    midi messages sent
+
+Handlers only request LED changes, which are sent in batches by the LED
+flush on the display tick, so the LED requests of a handler are its midi
+cost, and only the handlers that flush, update_display and resync, send
+any midi. Times, writes, requests and sends are inclusive, a handler is
+also charged for the draw methods and other handlers it calls. Gauges add
+other counters of the script to the summary, e.g. the depth of the LED
+queue.
+"""
+from Clock import monotonic_clock, precise_clock as timer
+
+CALLS, TOTAL_TIME, MAX_TIME, LIVE_WRITES, LED_REQUESTS, SENDS = range(6)
+
+
+class Instrumentation(object):
+    """
+    Per handler call counts, latencies, Live writes, LED requests and midi
+    sends.
+
+    live_writes:   function returning the number of Live writes made so far
+    led_requests:  function returning the number of LED changes requested
+                   so far
+    sends:         function returning the number of midi messages sent so far
+    dump_interval: seconds between summaries logged by dump_if_due, or None
+                   to only dump on demand
+    """
+    def __init__(self, names, live_writes, led_requests, sends,
+                 dump_interval=None, clock=monotonic_clock):
+        self._counters = dict((name, [0, 0.0, 0.0, 0, 0, 0])
+                              for name in names)
+        self._live_writes = live_writes
+        self._led_requests = led_requests
+        self._sends = sends
+        self.dump_interval = dump_interval
+        self._clock = clock
+        self._last_dump_time = clock()
+        self._gauges = []
+
+    def add_gauge(self, name, gauge):
+        """
+        Add a value to report at the end of the summary.
+
+        name:  the name to report the value by
+        gauge: function returning the current value
+        """
+        self._gauges.append((name, gauge))
+
+    def wrap(self, name, handler):
+        """
+        Returns the handler wrapped to update the counters of name.
+
+        name:    the name of the handler, one of the names given on creation
+        handler: the function to wrap
+        """
+        counters = self._counters[name]
+        live_writes = self._live_writes
+        led_requests = self._led_requests
+        sends = self._sends
+
+        def instrumented_handler(*args, **kwargs):
+            writes_before = live_writes()
+            requests_before = led_requests()
+            sends_before = sends()
+            start = timer()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                elapsed = timer() - start
+                counters[CALLS] += 1
+                counters[TOTAL_TIME] += elapsed
+                if elapsed > counters[MAX_TIME]:
+                    counters[MAX_TIME] = elapsed
+                counters[LIVE_WRITES] += live_writes() - writes_before
+                counters[LED_REQUESTS] += led_requests() - requests_before
+                counters[SENDS] += sends() - sends_before
+        return instrumented_handler
+
+    def counters(self, name):
+        """ Returns the counters of a handler as a tuple. """
+        return tuple(self._counters[name])
+
+    def reset(self):
+        """ Zero all counters. """
+        for counters in self._counters.values():
+            counters[:] = [0, 0.0, 0.0, 0, 0, 0]
+
+    def summary(self):
+        """
+        Returns one line per called handler, the slowest in total first,
+        followed by a line per gauge.
+        """
+        called = [(counters[TOTAL_TIME], name, counters)
+                  for name, counters in self._counters.items()
+                  if counters[CALLS]]
+        called.sort(reverse=True)
+        lines = ['%-26s %7d calls %10.0f us total %8.0f us max '
+                 '%6d writes %6d led requests %6d sends'
+                 % (name, counters[CALLS], counters[TOTAL_TIME] * 1e6,
+                    counters[MAX_TIME] * 1e6, counters[LIVE_WRITES],
+                    counters[LED_REQUESTS], counters[SENDS])
+                 for _, name, counters in called]
+        lines.extend('%-26s %7d' % (name, gauge())
+                     for name, gauge in self._gauges)
+        return lines
+
+    def dump(self, log_message):
+        """
+        Log the summary, one message per line.
+
+        log_message: function taking a string, e.g. DebugPrint.log_message
+        """
+        self._last_dump_time = self._clock()
+        log_message('Handler instrumentation:')
+        for line in self.summary():
+            log_message(line)
+
+    def dump_if_due(self, log_message):
+        """ Dump the summary if dump_interval seconds have passed. """
+        if (self.dump_interval is not None and
+                self._clock() - self._last_dump_time >= self.dump_interval):
+            self.dump(log_message)
@@ -0,0 +1,183 @@
+# Priority classes of LED changes, most urgent first
+FEEDBACK = 0 # the control being pressed
+STATE = 1 # Live state changing or being synced
+COSMETIC = 2 # animations
+NUM_PRIORITIES = 3
+
+
+class LedFramebuffer(object):
+    """
+    Shadow copy of the LED state of the controller, and the scheduler of
+    all the midi the script sends to it.
+
+    LEDs are referred to by their integer id in LedTable, one per element
+    color layer. Setting an LED only queues the change with a priority;
+    flush() then sends the net changes since the last flush, so an LED
+    turned on and back off before a flush sends nothing. LEDs that have
+    never been sent anything are in an unknown state and always get a
+    message.
+
+    The queue holds at most one change per LED: a new change to a queued
+    LED replaces the old one, keeping the more urgent priority. flush()
+    sends the queued changes by priority, then LED id, and stops after
+    max_sends messages, leaving the rest queued for the next flush, so that
+    large repaints reach the controller in bursts it can keep up with.
+
+    With max_pending, a full queue makes room for a FEEDBACK or STATE
+    change by dropping a COSMETIC one, and drops new COSMETIC changes, which
+    the animation draws again anyway. A FEEDBACK or STATE change that finds
+    no room is never lost: its LED is marked unknown and the change waits
+    outside the queue, to be queued on a later flush.
+    """
+    def __init__(self, send_midi, on_messages, off_messages, max_sends=None,
+                 max_pending=None):
+        if max_pending is not None and max_pending < 1:
+            raise ValueError('max_pending must be at least 1')
+        self._send_midi = send_midi
+        self._on_messages = on_messages
+        self._off_messages = off_messages
+        self._shown = [None] * len(on_messages)
+        self._pending = [{} for _ in range(NUM_PRIORITIES)]
+        self._priorities = {}
+        self._overflow = {}
+        self.max_sends = max_sends
+        self.max_pending = max_pending
+        self.request_count = 0
+        self.sent_count = 0
+        self.merged_count = 0
+        self.dropped_count = 0
+        self.deferred_count = 0
+        self.overflowed_count = 0
+        self.max_pending_count = 0
+
+    @property
+    def pending_count(self):
+        """ Number of LED changes waiting to be sent """
+        return len(self._priorities) + len(self._overflow)
+
+    @property
+    def skipped_count(self):
+        """ Number of requested LED changes that didn't need a message """
+        return (self.request_count - self.sent_count - self.pending_count -
+                self.dropped_count)
+
+    def set_lit(self, led, lit, priority=STATE):
+        """
+        Request an LED to be lit up or dimmed on the next flush.
+
+        led:      LED id of the element color layer
+        lit:      True to light up the LED, False to dim it
+        priority: FEEDBACK, STATE or COSMETIC
+        """
+        self.request_count += 1
+        if self._overflow:
+            self._overflow.pop(led, None) # superseded by this change
+        priorities = self._priorities
+        queued_priority = priorities.get(led)
+        if queued_priority is not None:
+            self.merged_count += 1
+            if queued_priority <= priority:
+                self._pending[queued_priority][led] = lit
+                return
+            del self._pending[queued_priority][led]
+        elif (self.max_pending is not None and
+                len(priorities) >= self.max_pending and
+                not self._make_room(priority)):
+            if priority == COSMETIC:
+                self.dropped_count += 1
+            else:
+                self._shown[led] = None
+                self._overflow[led] = (lit, priority)
+                self.overflowed_count += 1
+            return
+        self._queue(led, lit, priority)
+
+    def _queue(self, led, lit, priority):
+        """ Add a change for an LED that has none queued. """
+        priorities = self._priorities
+        self._pending[priority][led] = lit
+        priorities[led] = priority
+        if len(priorities) > self.max_pending_count:
+            self.max_pending_count = len(priorities)
+
+    def _make_room(self, priority):
+        """ Drop a queued COSMETIC change for a more urgent one, if any. """
+        cosmetic = self._pending[COSMETIC]
+        if priority == COSMETIC or not cosmetic:
+            return False
+        led, _ = cosmetic.popitem()
+        del self._priorities[led]
+        self.dropped_count += 1
+        return True
+
+    def _requeue_overflow(self):
+        """ Queue the changes that found no room, most urgent first. """
+        overflow = self._overflow
+        room = self.max_pending - len(self._priorities)
+        waiting = sorted(overflow.items(),
+                         key=lambda item: (item[1][1], item[0]))
+        for led, (lit, priority) in waiting[:room]:
+            del overflow[led]
+            self._queue(led, lit, priority)
+
+    def is_lit(self, led):
+        """ Returns True or False, or None if the LED state is unknown """
+        priority = self._priorities.get(led)
+        if priority is not None:
+            return self._pending[priority][led]
+        if led in self._overflow:
+            return self._overflow[led][0]
+        return self._shown[led]
+
+    def flush(self, max_sends=-1):
+        """
+        Send a message for every queued LED whose requested state differs
+        from the one last sent, most urgent first, up to max_sends messages.
+        Returns the number of messages sent.
+
+        max_sends: overrides the max_sends of the framebuffer, None sends
+                   everything that is waiting
+        """
+        if not self._priorities and not self._overflow:
+            return 0
+        if max_sends == -1:
+            max_sends = self.max_sends
+        sent = self._send(max_sends)
+        while self._overflow:
+            self._requeue_overflow()
+            if max_sends is not None:
+                break
+            sent += self._send(None)
+        return sent
+
+    def _send(self, max_sends):
+        """ Send the queued changes, up to max_sends messages. """
+        sent = 0
+        shown = self._shown
+        send_midi = self._send_midi
+        priorities = self._priorities
+        for pending in self._pending:
+            for led in sorted(pending):
+                lit = pending[led]
+                if shown[led] is not lit:
+                    if sent == max_sends:
+                        break
+                    shown[led] = lit
+                    if lit:
+                        send_midi(self._on_messages[led])
+                    else:
+                        send_midi(self._off_messages[led])
+                    sent += 1
+                del pending[led]
+                del priorities[led]
+            else:
+                continue
+            # Out of budget, the rest stays queued for the next flush
+            self.deferred_count += len(priorities)
+            break
+        self.sent_count += sent
+        return sent
+
+    def invalidate(self):
+        """ Forget all LED states, e.g. when the controller may have reset. """
+        self._shown = [None] * len(self._on_messages)
@@ -0,0 +1,110 @@
+"""
+LED layout of the Xone K2, corresponding to the midi implementation table in
+the Xone K2 manual, compiled at import into flat tables indexed by LED id.
+
+The K2 treats every color of an element as a separate layer with its own
+midi note. Every (element, color) layer gets an integer LED id, and the
+ready to send note on and note off messages of all LEDs are built once, so
+updating an LED is a tuple index instead of dict lookups and a new message.
+"""
+from _Framework.InputControlElement import MIDI_NOTE_OFF_STATUS
+from _Framework.InputControlElement import MIDI_NOTE_ON_STATUS
+
+COLORS = ('red', 'orange', 'green')
+
+# Element names and the notes of their red, orange and green layers
+ELEMENT_NOTE_NAMES = (
+    # top encoder row
+    ('top_encoder_1', ('e3', 'e6', 'e9')),
+    ('top_encoder_2', ('f3', 'f6', 'f9')),
+    ('top_encoder_3', ('f#3', 'f#6', 'f#9')),
+    ('top_encoder_4', ('g3', 'g6', 'g9')),
+    # first pot switches row
+    ('pot_switch_1', ('c3', 'c6', 'c9')),
+    ('pot_switch_2', ('c#3', 'c#6', 'c#9')),
+    ('pot_switch_3', ('d3', 'd6', 'd9')),
+    ('pot_switch_4', ('d#3', 'd#6', 'd#9')),
+    # second pot switches row
+    ('pot_switch_5', ('g#2', 'g#5', 'g#8')),
+    ('pot_switch_6', ('a2', 'a5', 'a8')),
+    ('pot_switch_7', ('a#2', 'a#5', 'a#8')),
+    ('pot_switch_8', ('b2', 'b5', 'b8')),
+    # third pot switches row
+    ('pot_switch_9', ('e2', 'e5', 'e8')),
+    ('pot_switch_10', ('f2', 'f5', 'f8')),
+    ('pot_switch_11', ('f#2', 'f#5', 'f#8')),
+    ('pot_switch_12', ('g2', 'g5', 'g8')),
+    # first matrix row
+    ('matrix_button_a', ('c2', 'c5', 'c8')),
+    ('matrix_button_b', ('c#2', 'c#5', 'c#8')),
+    ('matrix_button_c', ('d2', 'd5', 'd8')),
+    ('matrix_button_d', ('d#2', 'd#5', 'd#8')),
+    # second matrix row
+    ('matrix_button_e', ('g#1', 'g#4', 'g#7')),
+    ('matrix_button_f', ('a1', 'a4', 'a7')),
+    ('matrix_button_g', ('a#1', 'a#4', 'a#7')),
+    ('matrix_button_h', ('b1', 'b4', 'b7')),
+    # third matrix row
+    ('matrix_button_i', ('e1', 'e4', 'e7')),
+    ('matrix_button_j', ('f1', 'f4', 'f7')),
+    ('matrix_button_k', ('f#1', 'f#4', 'f#7')),
+    ('matrix_button_l', ('g1', 'g4', 'g7')),
+    # fourth matrix row
+    ('matrix_button_m', ('c1', 'c4', 'c7')),
+    ('matrix_button_n', ('c#1', 'c#4', 'c#7')),
+    ('matrix_button_o', ('d1', 'd4', 'd7')),
+    ('matrix_button_p', ('d#1', 'd#4', 'd#7')),
+    # bottom row encoder buttons
+    ('layer_button', ('c0', 'e0', 'g#0')),
+    ('exit_setup_button', ('d#0', 'g0', 'b0')),
+)
+
+
+def create_note_to_midi_dict():
+    """
+    Create a dict for the the midi implementation table in the Xone K2
+    manual, to make it easier to refer to the values of the midi notes.
+
+    The key value pairs are e.g. ('c#1', 25) or ('g4', 67).
+    """
+    notes = ['c','c#','d','d#','e','f', 'f#', 'g','g#','a','a#','b']
+    octaves = [str(num) for num in range(-1, 10)]
+    octave_notes = [note + octave for octave in octaves for note in notes]
+    return {octave_notes[i]: i for i in range(len(octave_notes))}
+
+
+def build_led_messages(channel):
+    """
+    Build the note on and note off message of every LED for a midi channel.
+
+    channel: zero based midi channel of the controller
+    Returns a tuple of on messages and a tuple of off messages, by LED id.
+    """
+    on_messages = tuple(
+        (MIDI_NOTE_ON_STATUS + channel, note, 127) for note in LED_NOTES)
+    off_messages = tuple(
+        (MIDI_NOTE_OFF_STATUS + channel, note, 127) for note in LED_NOTES)
+    return on_messages, off_messages
+
+
+def led_id(element_name, color):
+    """
+    Returns the LED id of an element color layer.
+
+    element_name: the name of the element, e.g. 'matrix_button_a'
+    color:        a string 'red', 'orange', or 'green'
+    """
+    return LED_IDS[element_name][color]
+
+
+NOTE_TO_MIDI = create_note_to_midi_dict()
+ELEMENT_COLOR_TO_MIDI = dict(
+    (element, dict(zip(COLORS, [NOTE_TO_MIDI[note] for note in notes])))
+    for element, notes in ELEMENT_NOTE_NAMES)
+LED_IDS = dict(
+    (element, dict((color, i * len(COLORS) + j)
+                   for j, color in enumerate(COLORS)))
+    for i, (element, _) in enumerate(ELEMENT_NOTE_NAMES))
+LED_NOTES = tuple(
+    NOTE_TO_MIDI[note] for _, notes in ELEMENT_NOTE_NAMES for note in notes)
+NUM_LEDS = len(LED_NOTES)
@@ -0,0 +1,44 @@
+class ListenerRegistry(object):
+    """
+    Owns the listeners the script adds to Live objects and controller
+    elements, so that they can be removed again.
+
+    Listeners are added in groups, e.g. one group per track for the
+    listeners on its EQ device parameters. Rebinding a group removes its old
+    listeners before new ones are added, and disconnect removes them all.
+    """
+    def __init__(self):
+        self._groups = {}
+        self.total_count = 0
+
+    @property
+    def live_count(self):
+        """ Number of listeners currently connected """
+        return sum(len(listeners) for listeners in self._groups.values())
+
+    def add(self, subject, event, listener, group=None):
+        """
+        Connect a listener using the subject's add_<event>_listener method.
+
+        subject:  Live object or controller element to listen to
+        event:    name of the event, e.g. 'value', 'mute' or 'devices'
+        listener: the callback to connect
+        group:    hashable key to remove the listener together with others
+        """
+        getattr(subject, 'add_%s_listener' % event)(listener)
+        self._groups.setdefault(group, []).append((subject, event, listener))
+        self.total_count += 1
+
+    def remove_group(self, group):
+        """ Disconnect all listeners that were added with the given group. """
+        for subject, event, listener in self._groups.pop(group, ()):
+            try:
+                if getattr(subject, '%s_has_listener' % event)(listener):
+                    getattr(subject, 'remove_%s_listener' % event)(listener)
+            except RuntimeError:
+                pass # the Live object has been deleted with its listeners
+
+    def remove_all(self):
+        """ Disconnect every listener in the registry. """
+        for group in list(self._groups):
+            self.remove_group(group)
@@ -0,0 +1,64 @@
+from _Framework.InputControlElement import MIDI_CC_TYPE
+from _Framework.InputControlElement import MIDI_CC_STATUS
+from _Framework.InputControlElement import MIDI_NOTE_OFF_STATUS
+from _Framework.InputControlElement import MIDI_NOTE_ON_STATUS
+from _Framework.InputControlElement import MIDI_NOTE_TYPE
+
+# Status bytes from note off (128) up to and including CC (176 - 191)
+FIRST_STATUS = MIDI_NOTE_OFF_STATUS
+LAST_STATUS = MIDI_CC_STATUS + 15
+TABLE_SIZE = (LAST_STATUS - FIRST_STATUS + 1) * 128
+
+
+class MidiDispatchTable(object):
+    """
+    Flat table dispatching incoming midi messages straight to their handler.
+
+    The table has a slot for every note and CC number of every status byte,
+    so finding the handler of a message is a single list index instead of
+    the framework's element lookup followed by the element's listeners.
+    A note off is dispatched to the handler of the note with value 0.
+    """
+    def __init__(self):
+        self._handlers = [None] * TABLE_SIZE
+
+    def add(self, element, handler):
+        """
+        Dispatch the messages of a controller element to a handler.
+
+        element: ButtonElement, SliderElement or EncoderElement to route
+        handler: callable taking the midi value, e.g. a partial of a
+                 XoneK2 handler and the index of its track
+        """
+        msg_type = element.message_type()
+        channel = element.message_channel()
+        identifier = element.message_identifier()
+        if msg_type == MIDI_NOTE_TYPE:
+            statuses = (MIDI_NOTE_ON_STATUS, MIDI_NOTE_OFF_STATUS)
+        elif msg_type == MIDI_CC_TYPE:
+            statuses = (MIDI_CC_STATUS,)
+        else:
+            raise ValueError('Unsupported message type %r' % msg_type)
+        for status in statuses:
+            slot = ((status + channel - FIRST_STATUS) << 7) | identifier
+            self._handlers[slot] = handler
+
+    def dispatch(self, midi_bytes):
+        """
+        Call the handler of a midi message. Returns False if the message has
+        no handler in the table.
+
+        midi_bytes: tuple of (status, note or CC number, value)
+        """
+        if len(midi_bytes) != 3:
+            return False
+        status, identifier, value = midi_bytes
+        if not FIRST_STATUS <= status <= LAST_STATUS:
+            return False
+        handler = self._handlers[((status - FIRST_STATUS) << 7) | identifier]
+        if handler is None:
+            return False
+        if status < MIDI_NOTE_ON_STATUS:
+            value = 0
+        handler(value)
+        return True
@@ -0,0 +1,114 @@
+"""
+Capture of the incoming midi of the script, for replaying a performance
+offline (see offline/replay.py).
+
+A recording file starts with MAGIC, followed by 7 byte records:
+
+    uint32 microseconds since the previous record, little endian
+    3 midi bytes
+
+A record with status byte 0 marks a display tick of Live, and a record with
+the time SESSION_START starts a new script session, as every session
+appends to the same file. The handlers only pack a record into a
+preallocated buffer; the buffer is written to the file once per tick.
+"""
+import os
+import struct
+
+from Clock import monotonic_clock
+
+MAGIC = b'XK2MIDI1'
+RECORD = struct.Struct('<IBBB')
+SESSION_START = 0xFFFFFFFF
+MAX_DELTA = SESSION_START - 1
+TICK_STATUS = 0
+
+
+class MidiRecorder(object):
+    """
+    Records incoming midi messages and display ticks with monotonic
+    timestamps.
+
+    path:     file the recording is appended to
+    capacity: number of records that can be buffered between two flushes,
+              records beyond that are dropped and counted
+    """
+    def __init__(self, path, capacity=4096, clock=monotonic_clock):
+        is_new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'ab')
+        if is_new_file:
+            self._file.write(MAGIC)
+        self._buffer = bytearray(RECORD.size * capacity)
+        self._end = len(self._buffer)
+        self._clock = clock
+        self._last_time = clock()
+        self.dropped_count = 0
+        RECORD.pack_into(self._buffer, 0, SESSION_START, 0, 0, 0)
+        self._offset = RECORD.size
+
+    def record(self, midi_bytes):
+        """
+        Buffer a 3 byte midi message. Other messages are not recorded.
+
+        midi_bytes: tuple of the status and data bytes of the message
+        """
+        offset = self._offset
+        if offset == self._end or len(midi_bytes) != 3:
+            self.dropped_count += 1
+            return
+        now = self._clock()
+        delta = int((now - self._last_time) * 1000000)
+        self._last_time = now
+        RECORD.pack_into(self._buffer, offset, min(delta, MAX_DELTA),
+                         midi_bytes[0], midi_bytes[1], midi_bytes[2])
+        self._offset = offset + RECORD.size
+
+    def record_tick(self):
+        """ Buffer a display tick marker. """
+        self.record((TICK_STATUS, 0, 0))
+
+    def flush(self):
+        """ Write the buffered records to the file. """
+        if self._offset:
+            self._file.write(memoryview(self._buffer)[:self._offset])
+            self._file.flush()
+            self._offset = 0
+
+    def close(self):
+        """ Write the remaining records and close the file. """
+        self.flush()
+        self._file.close()
+
+
+def read_recording(path):
+    """
+    Read a recording file.
+
+    path: file written by a MidiRecorder
+    Returns a list of sessions, each a list of (seconds since the start of
+    the session, midi bytes) tuples, where the midi bytes of a display tick
+    are None.
+    """
+    with open(path, 'rb') as recording:
+        data = recording.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not a midi recording' % path)
+    sessions = []
+    events = None
+    seconds = 0.0
+    end = len(data) - (len(data) - len(MAGIC)) % RECORD.size
+    for offset in range(len(MAGIC), end, RECORD.size):
+        delta, status, data1, data2 = RECORD.unpack_from(data, offset)
+        if delta == SESSION_START:
+            events = []
+            sessions.append(events)
+            seconds = 0.0
+            continue
+        if events is None:
+            raise ValueError('%s has records outside a session' % path)
+        seconds += delta / 1000000.0
+        if status == TICK_STATUS:
+            events.append((seconds, None))
+        else:
+            events.append((seconds, (status, data1, data2)))
+    return sessions
@@ -0,0 +1,96 @@
+"""
+Response curves mapping the 128 possible CC values of a fader or knob to a
+normalized Live parameter value.
+
+Curves are functions of the CC value, and are compiled with
+build_curve_table into 128 entry tuples once, so that the handlers only do
+an index lookup per message. Custom curves are built the same way:
+
+    build_curve_table(partial(eq_knob_value, dead_zone_x_range=0.2))
+"""
+import math
+
+NORMALIZED_ZERO_DB = 0.85000002384185791015625 # the value Live uses for 0 dB
+NUM_CC_VALUES = 128
+
+
+def volume_fader_value(value):
+    """
+    Maps the range [0, 127] to the range [-inf dBm, 0 dB], by scaling the
+    normalized fader MIDI value by the zero db value.
+    Note: Live uses the value 1.0 as 6 dB and 0.85 for 0 dB.
+
+    value: MIDI control change value, 0-127
+    """
+    normalized_fader_value = (value + 1.0) / 128.0
+    return normalized_fader_value * NORMALIZED_ZERO_DB
+
+
+def log_taper_fader_value(value, curvature=2.0):
+    """
+    Like volume_fader_value but with a logarithmic taper, giving finer
+    control close to 0 dB and a faster fall off towards -inf dB.
+
+    value: MIDI control change value, 0-127
+    curvature: steepness of the taper, higher values bend the curve more
+    """
+    normalized_fader_value = (value + 1.0) / 128.0
+    tapered = math.pow(10.0, curvature * normalized_fader_value) - 1.0
+    return tapered / (math.pow(10.0, curvature) - 1.0) * NORMALIZED_ZERO_DB
+
+
+def eq_knob_value(value, dead_zone_x_range=0.1):
+    """
+    Maps a knob to give 0 dB at 12 o'clock, 6 dB at full twist right and
+    -inf dB at full twist left, with a dead zone at 0 dB around the middle.
+
+    value: MIDI control change value, 0-127
+    dead_zone_x_range: width of the 0 dB dead zone, as a fraction of a twist
+    """
+    normalized_knob_value = (value + 1.0) / 128.0
+    lower_x_range = 0.5 - dead_zone_x_range / 2
+    lower_y_max = NORMALIZED_ZERO_DB
+    upper_x_range = 0.5 + dead_zone_x_range / 2
+    upper_y_range = 1.0 - lower_y_max
+    # Left twist, -inf dB to 0 dB
+    if normalized_knob_value <= lower_x_range:
+        scaled_knob_value = normalized_knob_value / lower_x_range
+        return scaled_knob_value * lower_y_max
+    # Dead zone 0 dB
+    elif normalized_knob_value <= (lower_x_range + dead_zone_x_range):
+        return NORMALIZED_ZERO_DB
+    # Right twist, 0 dB to 6 dB
+    else:
+        shifted_knob_value = normalized_knob_value - lower_x_range
+        scaled_knob_value = shifted_knob_value / upper_x_range
+        upper_y_value = scaled_knob_value * upper_y_range
+        return lower_y_max + upper_y_value
+
+
+def build_curve_table(curve):
+    """
+    Evaluate a curve for every CC value and return the results as a tuple.
+
+    curve: function taking a CC value 0-127 and returning a parameter value
+    """
+    return as_curve_table([curve(value) for value in range(NUM_CC_VALUES)])
+
+
+def as_curve_table(values):
+    """
+    Validate a sequence of 128 parameter values and return it as a tuple.
+
+    values: parameter values indexed by CC value, in the range [0.0, 1.0]
+    """
+    table = tuple(float(value) for value in values)
+    if len(table) != NUM_CC_VALUES:
+        raise ValueError('A curve table needs %d values, got %d'
+                         % (NUM_CC_VALUES, len(table)))
+    for value in table:
+        if not 0.0 <= value <= 1.0:
+            raise ValueError('Curve value %r is out of range' % value)
+    return table
+
+
+VOLUME_FADER_CURVE = build_curve_table(volume_fader_value)
+EQ_KNOB_CURVE = build_curve_table(eq_knob_value)
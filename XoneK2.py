@@ -1,54 +1,136 @@
-import time
+import math
+import os
 from functools import partial
 
 # Script imports
 import Live
-import MidiRemoteScript
 from _Framework.ButtonElement import ButtonElement
-from _Framework.ButtonMatrixElement import ButtonMatrixElement
 from _Framework.ControlSurface import ControlSurface
-from _Framework.DeviceComponent import DeviceComponent
 from _Framework.EncoderElement import EncoderElement
-from _Framework.InputControlElement import *
-from _Framework.MixerComponent import MixerComponent
-from _Framework.SessionComponent import SessionComponent
+from _Framework.InputControlElement import MIDI_CC_TYPE
+from _Framework.InputControlElement import MIDI_NOTE_TYPE
 from _Framework.SliderElement import SliderElement
-from _Framework.TransportComponent import TransportComponent
 
 # Debugging imports
 import DebugPrint
-import inspect
 
+from Coalescing import DetentAccumulator
+from ControlMapping import load_mapping
+from Coalescing import ParameterCoalescer
+from Coalescing import SoftTakeover
+from DeviceProfiles import ROLES
+from DeviceProfiles import find_eq_device
+from Instrumentation import Instrumentation
+from LedFramebuffer import COSMETIC
+from LedFramebuffer import FEEDBACK
+from LedFramebuffer import LedFramebuffer
+from LedFramebuffer import STATE
+from LedTable import NUM_LEDS
+from LedTable import build_led_messages
+from ListenerRegistry import ListenerRegistry
+from MidiDispatch import MidiDispatchTable
+from MidiRecorder import MidiRecorder
+from ResponseCurves import EQ_KNOB_CURVE
+from ResponseCurves import VOLUME_FADER_CURVE
+from ResponseCurves import as_curve_table
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 MIDI_CHANNEL_NUM = 15 - 1 # The Xone K2 uses midi channel 15
-NUM_TRACKS = 4
-NORMALIZED_ZERO_DB = 0.85000002384185791015625 # the value Live uses for 0 dB
-MUTE_BUTTON_COLOR = 'red'
-CUE_BUTTON_COLOR = 'orange'
-EQ_KILL_COLOR = 'red'
-EQ_CUT_COLOR = 'green'
-
-
-def Button(note_num, name=None):
-    button = ButtonElement(True, MIDI_NOTE_TYPE, MIDI_CHANNEL_NUM, note_num)
+# Midi channels of the K2 units served by the script, one per unit. Every
+# unit controls the next NUM_TRACKS tracks of the bank, in this order.
+UNIT_MIDI_CHANNELS = (MIDI_CHANNEL_NUM,)
+NUM_TRACKS = 4 # channel strips per unit
+# Which control drives which role, with which LED, see XoneK2Mapping.txt.
+# The compiled mapping is cached in MAPPING_CACHE_PATH (None to not cache).
+MAPPING_PATH = os.path.join(SCRIPT_DIR, 'XoneK2Mapping.txt')
+MAPPING_CACHE_PATH = os.path.join(SCRIPT_DIR, 'XoneK2Mapping.cache')
+WRITE_FIRST_VALUE_IMMEDIATELY = True # write the first CC of a burst at once
+# Ignore the faders and EQ knobs after their parameter is bound, until they
+# are moved past the current value of the parameter
+SOFT_TAKEOVER = False
+# Bits of the Live state cached per channel strip, kept up to date by the
+# listeners of the bound track and EQ device
+TRACK_MUTED = 1
+TRACK_SOLOED = 2
+EQ_DEVICE_ON = 4
+EQ_HI_ON = 8
+EQ_MID_ON = 16
+EQ_LOW_ON = 32
+# 'table' dispatches midi through a MidiDispatchTable, 'elements' through
+# value listeners on the controller elements
+DISPATCH_MODE = 'table'
+MIN_TEMPO = 20.0
+MAX_TEMPO = 999.0
+# Snap scrobble jumps to the 'beat' or 'bar' grid, or None to not snap
+SCROBBLE_SNAP = None
+# Blink the cue LEDs of cued tracks and the track stop LEDs of playing tracks
+# with the beat while the song plays, sending at most BEAT_LED_BUDGET LED
+# messages per display tick for it
+BEAT_FEEDBACK = True
+BEAT_LED_BUDGET = 8
+BEAT_FRAMES_PER_BEAT = 2 # lit for the first half of every beat
+# LED messages sent per display tick at most, the rest wait for the next
+# tick (None for no limit), and the number of LED changes that can be queued
+# before the least urgent are dropped (None to never drop any). The limit is
+# well below the 102 LEDs of a unit, so even a full wipe is spread over a few
+# ticks instead of going out in one burst the K2 may drop messages of.
+LED_MESSAGES_PER_TICK = 40
+LED_QUEUE_SIZE = None
+# Time the handlers below and count their Live writes, LED requests and
+# midi sends, and log a summary every INSTRUMENTATION_DUMP_INTERVAL seconds
+# (None to only log it on dump_instrumentation)
+INSTRUMENTATION = False
+INSTRUMENTATION_DUMP_INTERVAL = 10.0
+# Append every incoming midi message and display tick to this file, to
+# replay a set offline with offline/replay.py (None to not record)
+MIDI_RECORDING_PATH = None
+INSTRUMENTED_HANDLERS = (
+    'receive_midi', 'update_display', 'resync', 'commit_tempo_change',
+    'commit_scrobble_jumps', 'page_tracks', 'update_track_bank',
+    'bind_track', 'update_devices_bindings', 'bind_eq_device',
+    'on_nudge_back', 'on_nudge_up', 'on_coarse_tempo_change',
+    'on_coarse_encoder_push', 'on_fine_tempo_change', 'on_fine_encoder_push',
+    'on_mute_button_push', 'on_cue_button_push', 'on_track_stop_button_push',
+    'on_volume_fader_move', 'on_eq_kill_button_push', 'on_eq_cut_button_push',
+    'on_eq_knob_turn', 'on_scrobble_encoder_push', 'on_scrobble_change',
+    'update_playing_clip', 'on_song_time_change', 'on_song_playing_change',
+    'draw_all_elements', 'draw_animated_led', 'draw_beat_frame',
+    'draw_track_stop_button', 'draw_nudge_buttons', 'draw_mute_button',
+    'draw_cue_button', 'draw_eq_kill', 'draw_hi_eq_cut',
+    'draw_mid_eq_cut', 'draw_low_eq_cut', 'on_track_mute_change',
+    'on_track_solo_change', 'on_eq_param_change', 'on_song_nudge_change')
+
+
+def Button(note_num, channel, name=None):
+    button = ButtonElement(True, MIDI_NOTE_TYPE, channel, note_num)
     if name is not None:
         button.name = name
     return button
 
 
-def Fader(note_num):
-    return SliderElement(MIDI_CC_TYPE, MIDI_CHANNEL_NUM, note_num)
+def Fader(note_num, channel):
+    return SliderElement(MIDI_CC_TYPE, channel, note_num)
 
 
-def Knob(cc):
-    return EncoderElement(MIDI_CC_TYPE, MIDI_CHANNEL_NUM, cc,
+def Knob(cc, channel):
+    return EncoderElement(MIDI_CC_TYPE, channel, cc,
         Live.MidiMap.MapMode.absolute)
 
 
-def Encoder(cc):
-    return EncoderElement(MIDI_CC_TYPE, MIDI_CHANNEL_NUM, cc,
+def Encoder(cc, channel):
+    return EncoderElement(MIDI_CC_TYPE, channel, cc,
         Live.MidiMap.MapMode.absolute)
 
 
+# Control creating functions by kind of control in the mapping file
+CONTROL_KINDS = {
+    'button': Button,
+    'fader': Fader,
+    'knob': Knob,
+    'encoder': Encoder,
+}
+
+
 class XoneK2(ControlSurface):
     """
     The top level class of the script that extends the ControlSurface class,
@@ -61,243 +143,622 @@ class XoneK2(ControlSurface):
             self._set_suppress_rebuild_requests(True)
             self.c_instance = c_instance
             self.song = c_instance.song()
-            self.tracks = self.song.visible_tracks
-            self.note_to_midi = self._create_note_to_midi_dict()
-            self.element_color_to_midi = self._create_element_color_dict()
+            self.unit_channels = tuple(UNIT_MIDI_CHANNELS)
+            self.num_units = len(self.unit_channels)
+            self.num_strips = NUM_TRACKS * self.num_units
+            self.bank_offset = 0
+            self.mapping = load_mapping(MAPPING_PATH, MAPPING_CACHE_PATH)
+            self.listener_registry = ListenerRegistry()
+            self.midi_dispatch = None
+            if DISPATCH_MODE == 'table':
+                self.midi_dispatch = MidiDispatchTable()
+            on_messages, off_messages = (), ()
+            for channel in self.unit_channels:
+                unit_on_messages, unit_off_messages = build_led_messages(
+                    channel)
+                on_messages += unit_on_messages
+                off_messages += unit_off_messages
+            self.num_leds = len(on_messages)
+            self.leds = LedFramebuffer(
+                c_instance.send_midi, on_messages, off_messages,
+                LED_MESSAGES_PER_TICK, LED_QUEUE_SIZE)
+            self.volume_curve = VOLUME_FADER_CURVE
+            self.eq_curve = EQ_KNOB_CURVE
+            self.parameter_writes = ParameterCoalescer(
+                WRITE_FIRST_VALUE_IMMEDIATELY)
+            self.soft_takeover = None
+            if SOFT_TAKEOVER:
+                self.soft_takeover = SoftTakeover()
+            self.live_write_count = 0
+            self.midi_recorder = None
+            if MIDI_RECORDING_PATH is not None:
+                try:
+                    self.midi_recorder = MidiRecorder(MIDI_RECORDING_PATH)
+                except (IOError, OSError) as error:
+                    DebugPrint.error('Not recording midi to %s: %s',
+                                     MIDI_RECORDING_PATH, error)
+            self.instrumentation = None
+            if INSTRUMENTATION:
+                self.instrument_handlers()
 
             self.setup_data_structures()
             self.initialize_controller_components()
+            self.resync(force_full_wipe=True)
 
     def disconnect(self):
+        self.listener_registry.remove_all()
         self.dim_all_elements()
+        self.leds.flush(None) # there is no next tick to send the rest on
+        if self.midi_recorder is not None:
+            self.midi_recorder.close()
+            if self.midi_recorder.dropped_count:
+                DebugPrint.warning('Midi recording dropped %d records',
+                                   self.midi_recorder.dropped_count)
+        DebugPrint.flush()
+        super(XoneK2, self).disconnect()
+
+    def refresh_state(self):
+        """
+        Called by Live when the controller may have lost its state, e.g. when
+        its midi port comes back after a USB replug.
+        """
+        super(XoneK2, self).refresh_state()
+        self.resync(force_full_wipe=True)
+
+    def resync(self, force_full_wipe=False):
+        """
+        Repaint the whole surface from the Live state, with at most one
+        message per LED, spread over ticks by the LED scheduler.
+
+        force_full_wipe: also dim the LEDs believed to be dark already, for
+                         when the state of the controller is unknown
+        """
+        self.dim_all_elements(force_full_wipe)
+        self.draw_all_elements()
+        self.leds.flush()
+
+    def instrument_handlers(self):
+        """
+        Replace the handlers in INSTRUMENTED_HANDLERS with instrumented
+        wrappers. Must be called before the handlers are bound to controls
+        and listeners.
+        """
+        self.instrumentation = Instrumentation(
+            INSTRUMENTED_HANDLERS,
+            lambda: self.live_write_count + self.parameter_writes.write_count,
+            lambda: self.leds.request_count,
+            lambda: self.leds.sent_count,
+            INSTRUMENTATION_DUMP_INTERVAL)
+        for name in INSTRUMENTED_HANDLERS:
+            setattr(self, name,
+                    self.instrumentation.wrap(name, getattr(self, name)))
+        leds = self.leds
+        for name, attribute in (('led_queue_depth', 'pending_count'),
+                                ('led_queue_max_depth', 'max_pending_count'),
+                                ('led_changes_merged', 'merged_count'),
+                                ('led_changes_deferred', 'deferred_count'),
+                                ('led_changes_dropped', 'dropped_count'),
+                                ('led_changes_overflowed',
+                                 'overflowed_count')):
+            self.instrumentation.add_gauge(
+                name, partial(getattr, leds, attribute))
+        if self.midi_recorder is not None:
+            self.instrumentation.add_gauge(
+                'midi_records_dropped',
+                partial(getattr, self.midi_recorder, 'dropped_count'))
+        if self.soft_takeover is not None:
+            self.instrumentation.add_gauge(
+                'soft_takeover_ignored',
+                partial(getattr, self.soft_takeover, 'ignored_count'))
+        # The encoders are set up after the handlers are instrumented
+        self.instrumentation.add_gauge(
+            'coarse_tempo_detents',
+            lambda: self.coarse_tempo_detents.detent_count)
+        self.instrumentation.add_gauge(
+            'fine_tempo_detents', lambda: self.fine_tempo_detents.detent_count)
+
+    def dump_instrumentation(self):
+        """ Log the handler instrumentation summary, if enabled. """
+        if self.instrumentation is not None:
+            self.instrumentation.dump(DebugPrint.log_message)
+
+    def set_response_curves(self, volume_curve=None, eq_curve=None):
+        """
+        Replace the response curve tables of the volume faders or EQ knobs.
+
+        volume_curve: 128 volume values indexed by fader CC value, or None
+        eq_curve:     128 gain values indexed by EQ knob CC value, or None
+
+        See ResponseCurves for building tables from curve functions.
+        """
+        if volume_curve is not None:
+            self.volume_curve = as_curve_table(volume_curve)
+        if eq_curve is not None:
+            self.eq_curve = as_curve_table(eq_curve)
+            for i in range(self.num_strips):
+                self.update_eq_gain_curve(i)
+
+    def update_display(self):
+        """
+        Called by Live on every display tick (about every 100 ms).
+
+        Fader and knob values, tempo changes and scrobble jumps coalesced
+        during the tick are written to Live here, then the net LED changes of
+        the tick are sent in a single batch, and the buffered log messages
+        and recorded midi are written.
+        """
+        super(XoneK2, self).update_display()
+        if self.midi_recorder is not None:
+            self.midi_recorder.record_tick()
+        self.parameter_writes.flush()
+        self.commit_tempo_change()
+        self.commit_scrobble_jumps()
+        if self.beat_frame_dirty:
+            self.draw_beat_frame()
+        self.leds.flush()
+        if self.instrumentation is not None:
+            self.instrumentation.dump_if_due(DebugPrint.log_message)
+        DebugPrint.flush()
+        if self.midi_recorder is not None:
+            self.midi_recorder.flush()
+
+    def commit_tempo_change(self):
+        """
+        Apply the tempo encoder detents accumulated since the last tick to
+        the song tempo in a single write, rounded to hundredths of a BPM.
+        """
+        delta = self.coarse_tempo_detents.take()
+        delta += self.fine_tempo_detents.take()
+        if delta != 0.0:
+            tempo = round(self.song.tempo + delta, 2)
+            self.song.tempo = max(MIN_TEMPO, min(MAX_TEMPO, tempo))
+            self.live_write_count += 1
+
+    def commit_scrobble_jumps(self):
+        """
+        Move the playing clip of every strip that was scrobbled since the
+        last tick by the net offset of its detents, in a single write.
+        """
+        if not self.scrobble_offsets:
+            return
+        grid = None
+        if self.scrobble_snap == 'beat':
+            grid = 1.0
+        elif self.scrobble_snap == 'bar':
+            grid = (self.song.signature_numerator * 4.0 /
+                    self.song.signature_denominator)
+        for index, offset in self.scrobble_offsets.items():
+            clip = self.playing_clips[index]
+            if clip is None or offset == 0:
+                continue
+            position = clip.position + offset
+            if grid is not None:
+                # Snap in the direction of the jump, so it always moves
+                snap = math.ceil if offset > 0 else math.floor
+                position = snap(position / grid) * grid
+            clip.position = position
+            self.live_write_count += 1
+        self.scrobble_offsets.clear()
 
     def setup_data_structures(self):
+        strip_controls = partial(self.create_controls, True)
+        unit_controls = partial(self.create_controls, False)
+        strip_leds = self.strip_leds
         self.coarse_encoder_is_pushed = False
         self.fine_encoder_pushed = False
-        self.scrobble_encoder_pushed = [False] * NUM_TRACKS
-        self.eq3_devices = [None] * NUM_TRACKS
-        self.eq3_device_on_params = [None] * NUM_TRACKS
-        self.eq3_hi_cut_params = [None] * NUM_TRACKS
-        self.eq3_mid_cut_params = [None] * NUM_TRACKS
-        self.eq3_low_cut_params = [None] * NUM_TRACKS
-        self.eq3_hi_gain_params = [None] * NUM_TRACKS
-        self.eq3_mid_gain_params = [None] * NUM_TRACKS
-        self.eq3_low_gain_params = [None] * NUM_TRACKS
-
-        # Mute data
-        self.mute_buttons = [
-            Button(0x1C), Button(0x1D),
-            Button(0x1E), Button(0x1F)]
-        self.mute_elements = [
-            'matrix_button_i', 'matrix_button_j',
-            'matrix_button_k', 'matrix_button_l']
-
-        # Cue data
-        self.cue_buttons = [
-            Button(0x24), Button(0x25),
-            Button(0x26), Button(0x27)]
-        self.cue_elements = [
-            'matrix_button_a', 'matrix_button_b',
-            'matrix_button_c', 'matrix_button_d']
-
-        # EQ kill data
-        self.eq_kill_buttons = [
-            Button(0x20), Button(0x21),
-            Button(0x22), Button(0x23)]
-        self.eq_kill_elements = [
-            'matrix_button_e', 'matrix_button_f',
-            'matrix_button_g', 'matrix_button_h']
-
-        # Track stop data
-        self.track_stop_buttons = [
-            Button(0x18), Button(0x19),
-            Button(0x1A), Button(0x1B)]
-        self.track_stop_elements = [
-            'matrix_button_m', 'matrix_button_n',
-            'matrix_button_o', 'matrix_button_p']
-
-        # Volume fader data
-        self.volume_faders = [
-            Fader(0x10), Fader(0x11),
-            Fader(0x12), Fader(0x13)]
-
-        # High EQ data
-        self.hi_eq_knobs = [
-            Knob(0x04), Knob(0x05),
-            Knob(0x06), Knob(0x07)]
-        self.hi_eq_cut_buttons = [
-            Button(0x30), Button(0x31),
-            Button(0x32), Button(0x33)]
-        self.hi_eq_cut_elements = [
-            'pot_switch_1', 'pot_switch_2',
-            'pot_switch_3', 'pot_switch_4']
-
-        # Mid EQ data
-        self.mid_eq_knobs = [
-            Knob(0x08), Knob(0x09),
-            Knob(0x0A), Knob(0x0B)]
-        self.mid_eq_cut_buttons = [
-            Button(0x2C), Button(0x2D),
-            Button(0x2E), Button(0x2F)]
-        self.mid_eq_cut_elements = [
-            'pot_switch_5', 'pot_switch_6',
-            'pot_switch_7', 'pot_switch_8']
-
-        # Low EQ data
-        self.low_eq_knobs = [
-            Knob(0x0C), Knob(0x0D),
-            Knob(0x0E), Knob(0x0F)]
-        self.low_eq_cut_buttons = [
-            Button(0x28), Button(0x29),
-            Button(0x2A), Button(0x2B)]
-        self.low_eq_cut_elements = [
-            'pot_switch_9', 'pot_switch_10',
-            'pot_switch_11', 'pot_switch_12']
-
-        # Scrobble data
-        self.scrobble_knobs = [
-            Knob(0x00), Knob(0x01),
-            Knob(0x02), Knob(0x03)]
-        self.scrobble_push = [
-            Button(0x34), Button(0x35),
-            Button(0x36), Button(0x37)]
+        self.coarse_tempo_detents = DetentAccumulator()
+        self.fine_tempo_detents = DetentAccumulator()
+        self.scrobble_encoder_pushed = [False] * self.num_strips
+        self.scrobble_offsets = {}
+        self.scrobble_snap = SCROBBLE_SNAP
+        self.beat_feedback = BEAT_FEEDBACK
+        self.beat_led_budget = BEAT_LED_BUDGET
+        self.song_is_playing = self.song.is_playing
+        self.song_nudge_up = self.song.nudge_up
+        self.song_nudge_down = self.song.nudge_down
+        self.beat_phase = 0
+        self.beat_frame_dirty = False
+        self.animated_leds = set()
+        self.beat_frame = ()
+        self.playing_clips = [None] * self.num_strips
+        self.tracks = [None] * self.num_strips
+        self.strip_states = [0] * self.num_strips
+        self.volume_params = [None] * self.num_strips
+        self.eq_devices = [None] * self.num_strips
+        self.eq_profiles = [None] * self.num_strips
+        self.eq_gain_curves = [self.eq_curve] * self.num_strips
+        self.eq_device_on_params = [None] * self.num_strips
+        self.eq_hi_cut_params = [None] * self.num_strips
+        self.eq_mid_cut_params = [None] * self.num_strips
+        self.eq_low_cut_params = [None] * self.num_strips
+        self.eq_hi_gain_params = [None] * self.num_strips
+        self.eq_mid_gain_params = [None] * self.num_strips
+        self.eq_low_gain_params = [None] * self.num_strips
+
+        # Controls and LEDs of the channel strips, and of the units
+        self.mute_buttons = strip_controls('mute')
+        self.mute_leds = strip_leds('mute')
+        self.cue_buttons = strip_controls('cue')
+        self.cue_leds = strip_leds('cue')
+        self.eq_kill_buttons = strip_controls('eq_kill')
+        self.eq_kill_leds = strip_leds('eq_kill')
+        self.track_stop_buttons = strip_controls('track_stop')
+        self.track_stop_leds = strip_leds('track_stop')
+        self.volume_faders = strip_controls('volume')
+        self.hi_eq_knobs = strip_controls('hi_eq_gain')
+        self.hi_eq_cut_buttons = strip_controls('hi_eq_cut')
+        self.hi_eq_cut_leds = strip_leds('hi_eq_cut')
+        self.mid_eq_knobs = strip_controls('mid_eq_gain')
+        self.mid_eq_cut_buttons = strip_controls('mid_eq_cut')
+        self.mid_eq_cut_leds = strip_leds('mid_eq_cut')
+        self.low_eq_knobs = strip_controls('low_eq_gain')
+        self.low_eq_cut_buttons = strip_controls('low_eq_cut')
+        self.low_eq_cut_leds = strip_leds('low_eq_cut')
+        self.scrobble_knobs = strip_controls('scrobble')
+        self.scrobble_push = strip_controls('scrobble_push')
+        self.nudge_up_buttons = unit_controls('nudge_up')
+        self.nudge_up_leds = strip_leds('nudge_up')
+        self.nudge_back_buttons = unit_controls('nudge_back')
+        self.nudge_back_leds = strip_leds('nudge_back')
+        self.coarse_tempo_encoders = unit_controls('coarse_tempo')
+        self.coarse_tempo_push = unit_controls('coarse_tempo_push')
+        self.fine_tempo_encoders = unit_controls('fine_tempo')
+        self.fine_tempo_push = unit_controls('fine_tempo_push')
+
+    def create_controls(self, is_strip_role, role):
+        """
+        Create the controls of a role on all units, as mapped by the control
+        mapping.
+
+        is_strip_role: True for a role with a control per channel strip,
+                       indexed by strip, False for a role with a control per
+                       unit, indexed by unit
+        role:          the name of the role in the mapping, e.g. 'mute'
+        """
+        mapping = self.mapping
+        numbers = mapping.numbers(role)
+        num_controls = NUM_TRACKS if is_strip_role else 1
+        if (mapping.is_strip_role(role) != is_strip_role or
+                len(numbers) != num_controls):
+            raise ValueError('The control mapping needs %d %r control(s) '
+                             'per unit' % (num_controls, role))
+        create = CONTROL_KINDS[mapping.kind(role)]
+        return [create(number, channel)
+                for channel in self.unit_channels for number in numbers]
+
+    def strip_leds(self, role):
+        """
+        Returns the LED ids of a role on all units, indexed like the
+        controls of the role.
+
+        role: the name of the role in the mapping, e.g. 'mute'
+        """
+        leds = self.mapping.leds(role)
+        if leds is None:
+            raise ValueError('The control mapping has no LEDs for %r' % role)
+        return [unit * NUM_LEDS + led
+                for unit in range(self.num_units) for led in leds]
 
     def initialize_controller_components(self):
-        # Find EQ devices and update bindings
-        for i in range(NUM_TRACKS):
-            track = self.tracks[i]
-            dev_change_listener = partial(self.update_devices_bindings, i)
-            track.add_devices_listener(dev_change_listener)
-            self.update_devices_bindings(i) # look for any existing devies
-
-        # Nudge buttons
-        nudge_up_btn = Button(0x0F)
-        nudge_back_btn = Button(0x0C)
-        nudge_up_btn.add_value_listener(self.on_nudge_up)
-        nudge_back_btn.add_value_listener(self.on_nudge_back)
-
-        # Tempo encoders
-        coarse_tempo_enc = Encoder(0x14)
-        coarse_tempo_push = Button(0x0D)
-        fine_tempo_enc = Encoder(0x15)
-        fine_tempo_pushed = Button(0x0E)
-        coarse_tempo_enc.add_value_listener(self.on_coarse_tempo_change)
-        coarse_tempo_push.add_value_listener(self.on_coarse_encoder_push)
-        fine_tempo_enc.add_value_listener(self.on_fine_tempo_change)
-        fine_tempo_pushed.add_value_listener(self.on_fine_encoder_push)
+        bind_control = self.bind_control
+
+        # The nudge buttons and tempo encoders of every unit control the song
+        for unit in range(self.num_units):
+            # Nudge buttons
+            bind_control(self.nudge_up_buttons[unit],
+                         partial(self.on_nudge_up, unit))
+            bind_control(self.nudge_back_buttons[unit],
+                         partial(self.on_nudge_back, unit))
+
+            # Tempo encoders
+            bind_control(self.coarse_tempo_encoders[unit],
+                         self.on_coarse_tempo_change)
+            bind_control(self.coarse_tempo_push[unit],
+                         self.on_coarse_encoder_push)
+            bind_control(self.fine_tempo_encoders[unit],
+                         self.on_fine_tempo_change)
+            bind_control(self.fine_tempo_push[unit],
+                         self.on_fine_encoder_push)
 
         # Initialize mute buttons
-        for i in range(NUM_TRACKS):
-            on_mute_change_listener = partial(self.draw_mute_button, i)
-            self.tracks[i].add_mute_listener(on_mute_change_listener)
+        for i in range(self.num_strips):
             on_mute_button_listener = partial(self.on_mute_button_push, i)
-            self.mute_buttons[i].add_value_listener(on_mute_button_listener)
-            self.draw_mute_button(i)
+            bind_control(self.mute_buttons[i], on_mute_button_listener)
 
         # Initialize cue buttons
-        for i in range(NUM_TRACKS):
-            on_cue_change_listener = partial(self.draw_cue_button, i)
-            self.tracks[i].add_solo_listener(on_cue_change_listener)
+        for i in range(self.num_strips):
             on_cue_button_listener = partial(self.on_cue_button_push, i)
-            self.cue_buttons[i].add_value_listener(on_cue_button_listener)
-            self.draw_cue_button(i)
+            bind_control(self.cue_buttons[i], on_cue_button_listener)
 
         # Initialize EQ kill buttons:
-        for i in range(NUM_TRACKS):
+        for i in range(self.num_strips):
             kill_push_listener = partial(self.on_eq_kill_button_push, i)
-            self.eq_kill_buttons[i].add_value_listener(kill_push_listener)
+            bind_control(self.eq_kill_buttons[i], kill_push_listener)
 
         # Initialize track stop buttons:
-        for i in range(NUM_TRACKS):
+        for i in range(self.num_strips):
             stop_listener = partial(self.on_track_stop_button_push, i)
-            self.track_stop_buttons[i].add_value_listener(stop_listener)
+            bind_control(self.track_stop_buttons[i], stop_listener)
 
         # Initialize volume faders:
-        for i in range(NUM_TRACKS):
+        for i in range(self.num_strips):
             fader_move_listener = partial(self.on_volume_fader_move, i)
-            self.volume_faders[i].add_value_listener(fader_move_listener)
+            bind_control(self.volume_faders[i], fader_move_listener)
 
         # Initialize high EQ buttons:
-        for i in range(NUM_TRACKS):
+        for i in range(self.num_strips):
             hi_cut_listener = partial(self.on_eq_cut_button_push,
-                self.eq3_hi_cut_params, self.draw_hi_eq_cut, i)
-            self.hi_eq_cut_buttons[i].add_value_listener(hi_cut_listener)
-            self.draw_mid_eq_cut(i)
+                self.eq_hi_cut_params, EQ_HI_ON, self.draw_hi_eq_cut, i)
+            bind_control(self.hi_eq_cut_buttons[i], hi_cut_listener)
 
         # Initialize mid EQ buttons:
-        for i in range(NUM_TRACKS):
+        for i in range(self.num_strips):
             mid_cut_listener = partial(self.on_eq_cut_button_push,
-                self.eq3_mid_cut_params, self.draw_mid_eq_cut, i)
-            self.mid_eq_cut_buttons[i].add_value_listener(mid_cut_listener)
-            self.draw_mid_eq_cut(i)
+                self.eq_mid_cut_params, EQ_MID_ON, self.draw_mid_eq_cut, i)
+            bind_control(self.mid_eq_cut_buttons[i], mid_cut_listener)
 
         # Initialize low EQ buttons:
-        for i in range(NUM_TRACKS):
+        for i in range(self.num_strips):
             low_cut_listener = partial(self.on_eq_cut_button_push,
-                self.eq3_low_cut_params, self.draw_low_eq_cut, i)
-            self.low_eq_cut_buttons[i].add_value_listener(low_cut_listener)
-            self.draw_low_eq_cut(i)
+                self.eq_low_cut_params, EQ_LOW_ON, self.draw_low_eq_cut, i)
+            bind_control(self.low_eq_cut_buttons[i], low_cut_listener)
 
         # Initialize high EQ knobs:
-        for i in range(NUM_TRACKS):
+        for i in range(self.num_strips):
             hi_gain_listener = partial(
-                self.on_eq_knob_turn, self.eq3_hi_gain_params, i)
-            self.hi_eq_knobs[i].add_value_listener(hi_gain_listener)
+                self.on_eq_knob_turn, self.eq_hi_gain_params, i)
+            bind_control(self.hi_eq_knobs[i], hi_gain_listener)
 
         # Initialize mid EQ knobs:
-        for i in range(NUM_TRACKS):
+        for i in range(self.num_strips):
             mid_gain_listener = partial(
-                self.on_eq_knob_turn, self.eq3_mid_gain_params, i)
-            self.mid_eq_knobs[i].add_value_listener(mid_gain_listener)
+                self.on_eq_knob_turn, self.eq_mid_gain_params, i)
+            bind_control(self.mid_eq_knobs[i], mid_gain_listener)
 
         # Initialize low EQ knobs:
-        for i in range(NUM_TRACKS):
+        for i in range(self.num_strips):
             low_gain_listener = partial(
-                self.on_eq_knob_turn, self.eq3_low_gain_params, i)
-            self.low_eq_knobs[i].add_value_listener(low_gain_listener)
+                self.on_eq_knob_turn, self.eq_low_gain_params, i)
+            bind_control(self.low_eq_knobs[i], low_gain_listener)
 
         # Initialize scrobble knobs:
-        for i in range(NUM_TRACKS):
+        for i in range(self.num_strips):
             scrobble_encoder_listener = partial(self.on_scrobble_change, i)
             scrobble_push_listener = partial(self.on_scrobble_encoder_push, i)
-            self.scrobble_knobs[i].add_value_listener(scrobble_encoder_listener)
-            self.scrobble_push[i].add_value_listener(scrobble_push_listener)
+            bind_control(self.scrobble_knobs[i], scrobble_encoder_listener)
+            bind_control(self.scrobble_push[i], scrobble_push_listener)
+
+        # Show the song's nudge state, and animate LEDs with the beat
+        add_listener = self.listener_registry.add
+        add_listener(self.song, 'nudge_up', self.on_song_nudge_change)
+        add_listener(self.song, 'nudge_down', self.on_song_nudge_change)
+        if self.beat_feedback:
+            add_listener(
+                self.song, 'current_song_time', self.on_song_time_change)
+            add_listener(
+                self.song, 'is_playing', self.on_song_playing_change)
+
+        # Bind tracks to the channel strips, and rebind on track changes.
+        # This draws every strip, and __init__ starts sending it.
+        self.listener_registry.add(
+            self.song, 'visible_tracks', self.update_track_bank)
+        self.update_track_bank()
+
+    def bind_control(self, element, handler):
+        """
+        Route the messages of a controller element to a handler, through the
+        dispatch table, or as a value listener of the element if the table
+        is disabled.
 
-    def on_nudge_back(self, value):
-        """ Called when nudge back button pressed. """
-        if value == 127:
-            self.song.nudge_down = True
-            self.light_up_element('layer_button', 'orange')
+        element: ButtonElement, SliderElement or EncoderElement to bind
+        handler: callable taking the midi value
+        """
+        if self.midi_dispatch is not None:
+            self.midi_dispatch.add(element, handler)
         else:
-            self.song.nudge_down = False
-            self.dim_element('layer_button', 'orange')
+            self.listener_registry.add(element, 'value', handler)
 
-    def on_nudge_up(self, value):
-        """ Called when nudge up button pressed. """
-        if value == 127:
-            self.song.nudge_up = True
-            self.light_up_element('exit_setup_button', 'orange')
+    def receive_midi(self, midi_bytes):
+        """
+        Called by Live for every incoming midi message of the controller.
+
+        Messages are looked up in the dispatch table first, anything not in
+        it goes through the framework's element lookup.
+        """
+        if self.midi_recorder is not None:
+            self.midi_recorder.record(midi_bytes)
+        midi_dispatch = self.midi_dispatch
+        if midi_dispatch is None or not midi_dispatch.dispatch(midi_bytes):
+            super(XoneK2, self).receive_midi(midi_bytes)
+
+    def update_track_bank(self):
+        """
+        Bind the visible tracks starting at the bank offset to the channel
+        strips. Called whenever the visible tracks change, e.g. when tracks
+        are added, removed, reordered or folded.
+
+        Only strips whose track changed are rebound. Strips without a track,
+        at the end of the set, are left unbound.
+        """
+        visible_tracks = self.song.visible_tracks
+        num_visible = len(visible_tracks)
+        if self.bank_offset >= num_visible:
+            last_bank = max(0, num_visible - 1) // self.num_strips
+            self.bank_offset = last_bank * self.num_strips
+        for i in range(self.num_strips):
+            track_index = self.bank_offset + i
+            track = None
+            if track_index < num_visible:
+                track = visible_tracks[track_index]
+            if track != self.tracks[i]:
+                self.bind_track(i, track)
+
+    def page_tracks(self, direction):
+        """
+        Move the track bank one page of tracks, as many as the units have
+        channel strips, left or right.
+
+        direction: 1 to page right, -1 to page left
+        """
+        num_visible = len(self.song.visible_tracks)
+        offset = self.bank_offset + direction * self.num_strips
+        if 0 <= offset < num_visible:
+            self.bank_offset = offset
+            self.update_track_bank()
+
+    def bind_track(self, index, track):
+        """
+        Bind a track to a channel strip, replacing the listeners of the
+        track that was bound to it before.
+
+        index: index of the channel strip
+        track: Track.Track instance, or None to leave the strip unbound
+        """
+        add_listener = self.listener_registry.add
+        self.listener_registry.remove_group(('track', index))
+        if self.volume_params[index] is not None:
+            self.discard_parameter(self.volume_params[index])
+        self.tracks[index] = track
+        if track is not None:
+            self.volume_params[index] = track.mixer_device.volume
+            add_listener(track, 'devices',
+                partial(self.update_devices_bindings, index), ('track', index))
+            add_listener(track, 'mute',
+                partial(self.on_track_mute_change, index), ('track', index))
+            add_listener(track, 'solo',
+                partial(self.on_track_solo_change, index), ('track', index))
+            add_listener(track, 'playing_slot_index',
+                partial(self.update_playing_clip, index), ('track', index))
+            self.bind_eq_device(index, *find_eq_device(track.devices))
+        else:
+            self.volume_params[index] = None
+            self.bind_eq_device(index, None)
+        self.update_playing_clip(index)
+        self.on_track_mute_change(index)
+        self.on_track_solo_change(index)
+
+    def discard_parameter(self, parameter):
+        """
+        Drop the pending write and the soft takeover state of a parameter
+        that is no longer bound to its control.
+
+        parameter: the DeviceParameter that was bound
+        """
+        self.parameter_writes.discard(parameter)
+        if self.soft_takeover is not None:
+            self.soft_takeover.discard(parameter)
+
+    def set_strip_state(self, index, flag, on):
+        """
+        Set or clear a bit of the Live state cached for a channel strip.
+
+        index: index of the channel strip
+        flag:  the bit, e.g. TRACK_MUTED
+        on:    True to set the bit, False to clear it
+        """
+        if on:
+            self.strip_states[index] |= flag
         else:
-            self.song.nudge_up = False
-            self.dim_element('exit_setup_button', 'orange')
+            self.strip_states[index] &= ~flag
+
+    def on_track_mute_change(self, index):
+        """
+        Called by Live when the track of a channel strip is muted or unmuted,
+        and when a track is bound to the strip. Caches the mute state, so the
+        draws and the mute button don't need to ask Live.
+
+        index: index of the channel strip
+        """
+        track = self.tracks[index]
+        self.set_strip_state(index, TRACK_MUTED,
+                             track is not None and track.mute)
+        self.draw_mute_button(index)
+
+    def on_track_solo_change(self, index):
+        """
+        Called by Live when the track of a channel strip is soloed or
+        unsoloed, and when a track is bound to the strip. Caches the solo
+        state.
+
+        index: index of the channel strip
+        """
+        track = self.tracks[index]
+        self.set_strip_state(index, TRACK_SOLOED,
+                             track is not None and track.solo)
+        self.draw_cue_button(index)
+
+    def update_playing_clip(self, index):
+        """
+        Cache the playing clip of the track of a channel strip. Called when
+        the playing slot of the track changes, dropping the scrobble jump
+        pending for the clip that stopped.
+
+        index: index of the channel strip
+        """
+        track = self.tracks[index]
+        clip = None
+        if track is not None:
+            playing_slot_index = track.playing_slot_index
+            if playing_slot_index > -1:
+                clip = track.clip_slots[playing_slot_index].clip
+        self.playing_clips[index] = clip
+        self.scrobble_offsets.pop(index, None)
+        self.draw_track_stop_button(index)
+
+    def on_song_time_change(self):
+        """
+        Called by Live as the song position moves. Only notes when the beat
+        animation moves to its next frame, which is drawn on the next tick.
+        """
+        phase = int(self.song.current_song_time * BEAT_FRAMES_PER_BEAT)
+        if phase != self.beat_phase:
+            self.beat_phase = phase
+            self.beat_frame_dirty = True
+
+    def on_song_playing_change(self):
+        """ Called by Live when the song starts or stops playing. """
+        self.song_is_playing = self.song.is_playing
+        self.beat_frame_dirty = True
+
+    def on_song_nudge_change(self):
+        """ Called by Live when the song starts or stops nudging. """
+        self.song_nudge_up = self.song.nudge_up
+        self.song_nudge_down = self.song.nudge_down
+        self.draw_nudge_buttons()
+
+    def on_nudge_back(self, unit, value):
+        """
+        Called when nudge back button pressed on one of the units. The
+        buttons are lit by draw_nudge_buttons when the song nudges.
+        """
+        self.song.nudge_down = value == 127
+        self.live_write_count += 1
+
+    def on_nudge_up(self, unit, value):
+        """
+        Called when nudge up button pressed on one of the units. The
+        buttons are lit by draw_nudge_buttons when the song nudges.
+        """
+        self.song.nudge_up = value == 127
+        self.live_write_count += 1
 
     def on_coarse_tempo_change(self, value):
         """
         Called when the coarse tempo encoder is rotated.
         Change the tempo in whole steps, or in tenths if encoder is pushed.
+        The change is applied on the next display tick, and accelerated if
+        the encoder is spun fast.
+
+        While the fine tempo encoder is held down, the coarse encoder pages
+        the channel strips through the tracks instead.
 
         value: MIDI note value (1 = right turn, 127 = left turn)
         """
-        if value == 1:
-            if self.coarse_encoder_is_pushed:
-                self.song.tempo += 0.1
-            else:
-                self.song.tempo += 1.0
-        else:
-            if self.coarse_encoder_is_pushed:
-                self.song.tempo -= 0.1
-            else:
-                self.song.tempo -= 1.0
+        if self.fine_encoder_pushed:
+            self.page_tracks(1 if value == 1 else -1)
+            return
+        step = 0.1 if self.coarse_encoder_is_pushed else 1.0
+        self.coarse_tempo_detents.add_detent(step if value == 1 else -step)
 
     def on_coarse_encoder_push(self, value):
         """
@@ -314,19 +775,13 @@ class XoneK2(ControlSurface):
         """
         Called when the fine tempo encoder is rotated.
         Change the tempo in tenths, or in cents if encoder is pushed.
+        The change is applied on the next display tick, and accelerated if
+        the encoder is spun fast.
 
         value: MIDI note value (1 = right turn, 127 = left turn)
         """
-        if value == 1:
-            if self.fine_encoder_pushed:
-                self.song.tempo += 0.01
-            else:
-                self.song.tempo += 0.1
-        else:
-            if self.fine_encoder_pushed:
-                self.song.tempo -= 0.01
-            else:
-                self.song.tempo -= 0.1
+        step = 0.01 if self.fine_encoder_pushed else 0.1
+        self.fine_tempo_detents.add_detent(step if value == 1 else -step)
 
     def on_fine_encoder_push(self, value):
         """
@@ -347,13 +802,12 @@ class XoneK2(ControlSurface):
         value: MIDI note value (127 = pushed, 0 = depressed)
         """
         track = self.tracks[index]
-        mute_element = self.mute_elements[index]
+        if track is None:
+            return
         if value == 127:
-            track.mute = not track.mute
-        if not track.mute:
-            self.light_up_element(mute_element, MUTE_BUTTON_COLOR)
-        else:
-            self.dim_element(mute_element, MUTE_BUTTON_COLOR)
+            track.mute = not self.strip_states[index] & TRACK_MUTED
+            self.live_write_count += 1
+        self.draw_mute_button(index, FEEDBACK)
 
     def on_cue_button_push(self, index, value):
         """
@@ -363,9 +817,10 @@ class XoneK2(ControlSurface):
         value: MIDI note value (127 = pushed, 0 = depressed)
         """
         track = self.tracks[index]
-        if value == 127:
-            track.solo = not track.solo
-        self.draw_cue_button(index)
+        if track is not None and value == 127:
+            track.solo = not self.strip_states[index] & TRACK_SOLOED
+            self.live_write_count += 1
+        self.draw_cue_button(index, FEEDBACK)
 
     def on_track_stop_button_push(self, index, value):
         """
@@ -375,147 +830,181 @@ class XoneK2(ControlSurface):
         value: MIDI note value (127 = pushed, 0 = depressed)
         """
         track = self.tracks[index]
-        stop_element = self.track_stop_elements[index]
+        if track is None:
+            return
         if value == 127:
-            self.light_up_element(stop_element, 'red')
             track.stop_all_clips(Quantized=False)
+            self.live_write_count += 1
+            self.leds.set_lit(self.track_stop_leds[index], True, FEEDBACK)
         else:
-            self.dim_element(stop_element, 'red')
+            self.draw_track_stop_button(index, FEEDBACK)
 
     def on_volume_fader_move(self, index, value):
         """
         Sets the associated track volume according to the fader position.
 
-        The fader maps the range [0, 127] to the range [-inf dBm, 0 dB], by
-        scaling the normalized fader MIDI value by the zero db value.
-        Note: Live uses the value 1.0 as 6 dB and 0.85 for 0 dB.
+        The fader position is looked up in the volume curve table, which by
+        default maps the range [0, 127] to the range [-inf dBm, 0 dB]. The
+        write to Live is coalesced with the rest of the tick's fader moves.
 
         index: index of track to associate with this listener
         value: MIDI control change value, 0-127
         """
-        track = self.tracks[index]
-        normalized_fader_value = (value + 1.0) / 128.0
-        new_volume = normalized_fader_value * NORMALIZED_ZERO_DB
-        track.mixer_device.volume.value = new_volume
+        volume_param = self.volume_params[index]
+        if volume_param is not None:
+            self.set_parameter(volume_param, self.volume_curve, value)
 
     def update_devices_bindings(self, index):
         """
         Called whenever a device is added or removed from associated track.
 
         This listener is used to make sure that this script is kept in sync
-        with the available EQ3 devices in the Live session.
+        with the EQ devices in the Live session. If the track's best matching
+        EQ device is still the one bound, nothing needs to be done.
 
         index: index of track to associate with this listener
         """
-        # Find devices and parameters
-        track = self.tracks[index]
-        eq3 = find_eq3_device(track)
-        self.eq3_devices[index] = eq3
-        if eq3 is not None:
-            # find 'device on' parameter
-            device_on_param = get_eq3_parameter(eq3, 'Device On')
-            self.eq3_device_on_params[index] = device_on_param
-            if device_on_param is not None:
-                device_on_listener = partial(self.draw_eq_kill, index)
-                device_on_param.add_value_listener(device_on_listener)
-            # find 'hi on' parameter
-            hi_cut_param = get_eq3_parameter(eq3, 'HighOn')
-            self.eq3_hi_cut_params[index] = hi_cut_param
-            if hi_cut_param is not None:
-                hi_cut_listener = partial(self.draw_hi_eq_cut, index)
-                hi_cut_param.add_value_listener(hi_cut_listener)
-            # find 'mid on' parameter
-            mid_cut_param = get_eq3_parameter(eq3, 'MidOn')
-            self.eq3_mid_cut_params[index] = mid_cut_param
-            if mid_cut_param is not None:
-                mid_cut_listener = partial(self.draw_mid_eq_cut, index)
-                mid_cut_param.add_value_listener(mid_cut_listener)
-            # find 'low on' parameter
-            low_cut_param = get_eq3_parameter(eq3, 'LowOn')
-            self.eq3_low_cut_params[index] = low_cut_param
-            if low_cut_param is not None:
-                low_cut_listener = partial(self.draw_low_eq_cut, index)
-                low_cut_param.add_value_listener(low_cut_listener)
-            # find 'hi gain' parameter
-            hi_gain_param = get_eq3_parameter(eq3, 'GainHi')
-            self.eq3_hi_gain_params[index] = hi_gain_param
-            # find 'mid gain' parameter
-            mid_gain_param = get_eq3_parameter(eq3, 'GainMid')
-            self.eq3_mid_gain_params[index] = mid_gain_param
-            # find 'low gain' parameter
-            low_gain_param = get_eq3_parameter(eq3, 'GainLo')
-            self.eq3_low_gain_params[index] = low_gain_param
+        device, profile, parameters = find_eq_device(
+            self.tracks[index].devices)
+        if device != self.eq_devices[index]:
+            self.bind_eq_device(index, device, profile, parameters)
+
+    def bind_eq_device(self, index, device, profile=None, parameters=None):
+        """
+        Bind the parameters of an EQ device to the controls of a track.
+
+        index:      index of track to associate with the device
+        device:     Device.Device instance, or None to unbind
+        profile:    the DeviceProfile the device matches
+        parameters: the parameters of the device by role, as found by
+                    find_eq_device
+        """
+        # Forget the gain parameters of the old binding
+        for gain_params in (self.eq_hi_gain_params, self.eq_mid_gain_params,
+                            self.eq_low_gain_params):
+            if gain_params[index] is not None:
+                self.discard_parameter(gain_params[index])
+        # Remove the listeners of the old binding
+        self.listener_registry.remove_group(('eq', index))
+        # Bind the parameters of the new device
+        self.eq_devices[index] = device
+        self.eq_profiles[index] = profile
+        self.update_eq_gain_curve(index)
+        if device is None:
+            parameters = [None] * len(ROLES)
+        (device_on_param, hi_cut_param, mid_cut_param, low_cut_param,
+         hi_gain_param, mid_gain_param, low_gain_param) = parameters
+        self.eq_device_on_params[index] = device_on_param
+        self.eq_hi_cut_params[index] = hi_cut_param
+        self.eq_mid_cut_params[index] = mid_cut_param
+        self.eq_low_cut_params[index] = low_cut_param
+        self.eq_hi_gain_params[index] = hi_gain_param
+        self.eq_mid_gain_params[index] = mid_gain_param
+        self.eq_low_gain_params[index] = low_gain_param
+        # Cache the state of the switches and redraw their buttons, now and
+        # whenever their parameter changes
+        for param, flag, draw_button in (
+                (device_on_param, EQ_DEVICE_ON, self.draw_eq_kill),
+                (hi_cut_param, EQ_HI_ON, self.draw_hi_eq_cut),
+                (mid_cut_param, EQ_MID_ON, self.draw_mid_eq_cut),
+                (low_cut_param, EQ_LOW_ON, self.draw_low_eq_cut)):
+            param_listener = partial(
+                self.on_eq_param_change, index, param, flag, draw_button)
+            if param is not None:
+                self.listener_registry.add(
+                    param, 'value', param_listener, ('eq', index))
+            param_listener()
+
+    def update_eq_gain_curve(self, index):
+        """
+        Scale the EQ knob curve to the gains of the EQ device of a strip.
+
+        index: index of the channel strip
+        """
+        profile = self.eq_profiles[index]
+        if profile is not None:
+            self.eq_gain_curves[index] = profile.gain_curve(self.eq_curve)
         else:
-            self.eq3_device_on_params[index] = None
-            self.eq3_hi_cut_params[index] = None
-            self.eq3_mid_cut_params[index] = None
-            self.eq3_low_cut_params[index] = None
-        # Update views
-        self.draw_eq_kill(index)
-        self.draw_hi_eq_cut(index)
-        self.draw_mid_eq_cut(index)
-        self.draw_low_eq_cut(index)
+            self.eq_gain_curves[index] = self.eq_curve
+
+    def on_eq_param_change(self, index, param, flag, draw_button):
+        """
+        Called by Live when an EQ switch parameter of a channel strip
+        changes, and when the EQ device is bound. Caches the state of the
+        switch and redraws its button.
+
+        index:       index of the channel strip
+        param:       the switch DeviceParameter, or None if unbound
+        flag:        the bit caching the parameter, e.g. EQ_HI_ON
+        draw_button: function for drawing the button
+        """
+        self.set_strip_state(
+            index, flag, param is not None and param.value == 1.0)
+        draw_button(index)
 
     def on_eq_kill_button_push(self, index, value):
         """
-        Toggle the EQ3 on-state to create a EQ kill functionality.
+        Toggle the on-state of the EQ device to create a EQ kill
+        functionality.
 
         index: index of track to associate with this listener
         value: MIDI note value (127 = pushed, 0 = depressed)
         """
-        eq3_device_on = self.eq3_device_on_params[index]
-        if eq3_device_on is not None and value == 127:
-            eq3_device_on.value = abs(eq3_device_on.value - 1.0)
-        self.draw_eq_kill(index)
-
-    def on_eq_cut_button_push(self, eq3_cut_params, draw_button, index, value):
+        eq_device_on = self.eq_device_on_params[index]
+        if eq_device_on is not None and value == 127:
+            is_on = self.strip_states[index] & EQ_DEVICE_ON
+            eq_device_on.value = 0.0 if is_on else 1.0
+            self.live_write_count += 1
+        self.draw_eq_kill(index, FEEDBACK)
+
+    def on_eq_cut_button_push(self, eq_cut_params, flag, draw_button, index,
+                              value):
         """
-        Kill an EQ3 band of the associated track.
+        Kill an EQ band of the associated track.
 
-        eq3_cut_params: list of 'EQ Three' DeviceParameter instances
+        eq_cut_params: list of band switch DeviceParameter instances
+        flag: the bit caching the state of the parameters, e.g. EQ_HI_ON
         draw_button: function for drawing the button
         index: index of track to associate with this listener
         value: MIDI note value (127 = pushed, 0 = depressed)
         """
-        eq3_cut_param = eq3_cut_params[index]
-        if eq3_cut_param is not None and value == 127:
-            eq3_cut_param.value = abs(eq3_cut_param.value - 1.0)
-        draw_button(index)
+        eq_cut_param = eq_cut_params[index]
+        if eq_cut_param is not None and value == 127:
+            is_on = self.strip_states[index] & flag
+            eq_cut_param.value = 0.0 if is_on else 1.0
+            self.live_write_count += 1
+        draw_button(index, FEEDBACK)
 
     def on_eq_knob_turn(self, gain_params, index, value):
         """
         Change the gain of the EQ band of the associated track.
 
-        The knob is mapped to give 0 dB at 12 o'clock, 6 dB at full twist right
-        and -inf dB at full twist left.
+        The knob position is looked up in the EQ curve table, which by default
+        gives 0 dB at 12 o'clock, 6 dB at full twist right and -inf dB at full
+        twist left, scaled to the gain range of the bound EQ device. The write
+        to Live is coalesced with the rest of the tick's knob turns.
 
-        gain_params: list containing 'EQ Three' Device.Device instances
+        gain_params: list of band gain DeviceParameter instances
         index: index of track to associate with this listener
         value: MIDI control change value, 0-127
         """
         gain_param = gain_params[index]
         if gain_param is not None:
-            normalized_knob_value = (value + 1.0) / 128.0
-            dead_zone_x_range = 0.1
-            lower_x_range = 0.5 - dead_zone_x_range / 2
-            lower_y_max = NORMALIZED_ZERO_DB
-            upper_x_range = 0.5 + dead_zone_x_range / 2
-            upper_y_range = 1.0 - lower_y_max
-            upper_y_max = 1.0
-            # Left twist, -inf dB to 0 dB
-            if normalized_knob_value <= lower_x_range:
-                scaled_knob_value = normalized_knob_value / lower_x_range
-                new_gain_value = scaled_knob_value * lower_y_max
-            # Dead zone 0 dB
-            elif normalized_knob_value <= (lower_x_range + dead_zone_x_range):
-                new_gain_value = NORMALIZED_ZERO_DB
-            # Right twist, 0 dB to 6 dB
-            else:
-                shifted_knob_value = normalized_knob_value - lower_x_range
-                scaled_knob_value = shifted_knob_value / upper_x_range
-                upper_y_value = scaled_knob_value * upper_y_range
-                new_gain_value = lower_y_max + upper_y_value
-            gain_param.value = new_gain_value
+            self.set_parameter(gain_param, self.eq_gain_curves[index], value)
+
+    def set_parameter(self, parameter, curve, value):
+        """
+        Write the value of a fader or knob to its parameter on the next
+        tick, unless the control has yet to pick up the parameter.
+
+        parameter: the DeviceParameter the control is bound to
+        curve:     the curve table of the control
+        value:     MIDI control change value, 0-127
+        """
+        value = curve[value]
+        if (self.soft_takeover is None or
+                self.soft_takeover.accept(parameter, value, curve)):
+            self.parameter_writes.set_value(parameter, value)
 
     def on_scrobble_encoder_push(self, index, value):
         """
@@ -531,370 +1020,168 @@ class XoneK2(ControlSurface):
         Called when scrobble knob is turned, moves beat forward/backward.
 
         Moves the playback one bar forward/backward, or a quarter beat if
-        the knob is pressed.
+        the knob is pressed. The jumps of a tick are added up and applied to
+        the playing clip on the next display tick.
 
         index: index of track to associate with this listener.
         value: MIDI note value (1 = right turn, 127 = left turn)
         """
-        track = self.tracks[index]
-        playback_index = track.playing_slot_index
-        encoder_pushed = self.scrobble_encoder_pushed[index]
         # Move playback position if clip is playing
-        if playback_index > -1:
-            num_beats = 1 if encoder_pushed else 4
+        if self.playing_clips[index] is not None:
+            num_beats = 1 if self.scrobble_encoder_pushed[index] else 4
             playback_offset = -num_beats if value == 127 else num_beats
-            clip = track.clip_slots[playback_index].clip
-            clip.position += playback_offset
+            offsets = self.scrobble_offsets
+            offsets[index] = offsets.get(index, 0) + playback_offset
 
-    def draw_mute_button(self, index):
+    def draw_mute_button(self, index, priority=STATE):
         """
         Light up or dim the mute button based on its state.
 
         index: index of track associated with the mute button
+        priority: priority of the LED change
         """
-        track = self.tracks[index]
-        mute_element = self.mute_elements[index]
-        if not track.mute:
-            self.light_up_element(mute_element, MUTE_BUTTON_COLOR)
-        else:
-            self.dim_element(mute_element, MUTE_BUTTON_COLOR)
+        lit = (self.tracks[index] is not None and
+               not self.strip_states[index] & TRACK_MUTED)
+        self.leds.set_lit(self.mute_leds[index], lit, priority)
 
-    def draw_cue_button(self, index):
+    def draw_cue_button(self, index, priority=STATE):
         """
         Light up or dim the cue button based on its state.
 
         index: index of track associated with the cue button
+        priority: priority of the LED change
         """
-        track = self.tracks[index]
-        cue_element = self.cue_elements[index]
-        if track.solo:
-            self.light_up_element(cue_element, CUE_BUTTON_COLOR)
-        else:
-            self.dim_element(cue_element, CUE_BUTTON_COLOR)
+        lit = self.strip_states[index] & TRACK_SOLOED != 0
+        self.draw_animated_led(self.cue_leds[index], lit, priority)
 
-    def draw_eq_kill(self, index):
+    def draw_track_stop_button(self, index, priority=STATE):
+        """
+        Pulse the track stop button with the beat while its track plays a
+        clip, if BEAT_FEEDBACK is on, otherwise dim it.
+
+        index: index of track associated with the track stop button
+        priority: priority of the LED change
+        """
+        playing = self.beat_feedback and self.playing_clips[index] is not None
+        self.draw_animated_led(
+            self.track_stop_leds[index], playing, priority)
+
+    def draw_nudge_buttons(self):
+        """ Light up the nudge buttons of all units while nudging. """
+        nudge_up = self.song_nudge_up
+        nudge_down = self.song_nudge_down
+        for unit in range(self.num_units):
+            self.leds.set_lit(self.nudge_up_leds[unit], nudge_up, FEEDBACK)
+            self.leds.set_lit(
+                self.nudge_back_leds[unit], nudge_down, FEEDBACK)
+
+    def draw_animated_led(self, led, lit, priority=STATE):
+        """
+        Light up an LED that blinks with the beat while the song plays, if
+        BEAT_FEEDBACK is on, or dim it.
+
+        led:      LED id of the element color layer
+        lit:      True to light up the LED, False to dim it
+        priority: priority of the LED change
+        """
+        if self.beat_feedback and lit != (led in self.animated_leds):
+            if lit:
+                self.animated_leds.add(led)
+            else:
+                self.animated_leds.discard(led)
+            self.beat_frame = tuple(sorted(self.animated_leds))
+        if lit and self.beat_feedback:
+            lit = self.beat_frame_lit()
+        self.leds.set_lit(led, lit, priority)
+
+    def beat_frame_lit(self):
+        """ Returns True if the animated LEDs are lit in this frame. """
+        return (not self.song_is_playing or
+                self.beat_phase % BEAT_FRAMES_PER_BEAT == 0)
+
+    def draw_beat_frame(self):
+        """
+        Draw the current frame of the beat animation, sending at most
+        beat_led_budget LED messages. LEDs over the budget are drawn on the
+        next tick.
+        """
+        lit = self.beat_frame_lit()
+        budget = self.beat_led_budget
+        leds = self.leds
+        for led in self.beat_frame:
+            if leds.is_lit(led) is not lit:
+                if budget == 0:
+                    return
+                leds.set_lit(led, lit, COSMETIC)
+                budget -= 1
+        self.beat_frame_dirty = False
+
+    def draw_eq_kill(self, index, priority=STATE):
         """
         Light up or dim the EQ kill button based on its state.
 
         index: index of track associated with the eq kill button
+        priority: priority of the LED change
         """
-        eq_kill_element = self.eq_kill_elements[index]
-        device_on_param = self.eq3_device_on_params[index]
-        if device_on_param is not None and device_on_param.value == 1.0:
-            self.light_up_element(eq_kill_element, EQ_KILL_COLOR)
-        else:
-            self.dim_element(eq_kill_element, EQ_KILL_COLOR)
+        lit = self.strip_states[index] & EQ_DEVICE_ON != 0
+        self.leds.set_lit(self.eq_kill_leds[index], lit, priority)
 
-    def draw_hi_eq_cut(self, index):
+    def draw_hi_eq_cut(self, index, priority=STATE):
         """
         Light up or dim the high EQ button based on its state.
 
         index: index of track associated with the high cut button
+        priority: priority of the LED change
         """
-        hi_cut_element = self.hi_eq_cut_elements[index]
-        hi_cut = self.eq3_hi_cut_params[index]
-        if hi_cut is not None and hi_cut.value == 1.0:
-            self.light_up_element(hi_cut_element, EQ_CUT_COLOR)
-        else:
-            self.dim_element(hi_cut_element, EQ_CUT_COLOR)
+        lit = self.strip_states[index] & EQ_HI_ON != 0
+        self.leds.set_lit(self.hi_eq_cut_leds[index], lit, priority)
 
-    def draw_mid_eq_cut(self, index):
+    def draw_mid_eq_cut(self, index, priority=STATE):
         """
         Light up or dim the mid EQ button based on its state.
 
         index: index of track associated with the mid cut button
+        priority: priority of the LED change
         """
-        mid_cut_element = self.mid_eq_cut_elements[index]
-        mid_cut = self.eq3_mid_cut_params[index]
-        if mid_cut is not None and mid_cut.value == 1.0:
-            self.light_up_element(mid_cut_element, EQ_CUT_COLOR)
-        else:
-            self.dim_element(mid_cut_element, EQ_CUT_COLOR)
+        lit = self.strip_states[index] & EQ_MID_ON != 0
+        self.leds.set_lit(self.mid_eq_cut_leds[index], lit, priority)
 
-    def draw_low_eq_cut(self, index):
+    def draw_low_eq_cut(self, index, priority=STATE):
         """
         Light up or dim the low EQ button based on its state.
 
         index: index of track associated with the low cut button
+        priority: priority of the LED change
         """
-        low_cut_element = self.low_eq_cut_elements[index]
-        low_cut = self.eq3_low_cut_params[index]
-        if low_cut is not None and low_cut.value == 1.0:
-            self.light_up_element(low_cut_element, EQ_CUT_COLOR)
-        else:
-            self.dim_element(low_cut_element, EQ_CUT_COLOR)
-
-    def light_up_element(self, element_name, color):
-        """
-        Send a midi message to light up a controller element.
+        lit = self.strip_states[index] & EQ_LOW_ON != 0
+        self.leds.set_lit(self.low_eq_cut_leds[index], lit, priority)
 
-        element_name: the name of the element to light up
-        color:        a string 'red', 'orange', or 'green'
-        """
-        status = MIDI_NOTE_ON_STATUS + MIDI_CHANNEL_NUM
-        note = self.element_color_to_midi[element_name][color]
-        velocity = 127
-        self.c_instance.send_midi((status, note, velocity))
+    def draw_all_elements(self):
+        """ Draw every element that shows Live state. """
+        for i in range(self.num_strips):
+            self.draw_mute_button(i)
+            self.draw_cue_button(i)
+            self.draw_track_stop_button(i)
+            self.draw_eq_kill(i)
+            self.draw_hi_eq_cut(i)
+            self.draw_mid_eq_cut(i)
+            self.draw_low_eq_cut(i)
 
-    def dim_element(self, element_name, color='red'):
-        """
-        Send a midi message to turn off the light of an element.
+        self.draw_nudge_buttons()
 
-        element_name: the name of the element to dim
-        color:        a string 'red', 'orange', or 'green'
-        """
-        status = MIDI_NOTE_OFF_STATUS + MIDI_CHANNEL_NUM
-        note = self.element_color_to_midi[element_name][color]
-        velocity = 127
-        self.c_instance.send_midi((status, note, velocity))
-
-    def dim_all_elements(self):
+    def dim_all_elements(self, force_full_wipe=False):
         """
         Reset all the elements of the controller to dimmed.
 
         The K2 seems to treat the different colors like different layers, the
         only reliable way to dim everything is to loop through all 3 colors.
-        """
-        for element, _ in self.element_color_to_midi.iteritems():
-            self.dim_element(element, 'red')
-        for element, _ in self.element_color_to_midi.iteritems():
-            self.dim_element(element, 'orange')
-        for element, _ in self.element_color_to_midi.iteritems():
-            self.dim_element(element, 'green')
-
-    def _create_note_to_midi_dict(self):
-        """
-        Create a dict for the the midi implementation table in the Xone K2
-        manual, to make it easier to refer to the values of the midi notes.
-
-        The key value pairs are e.g. ('c#1', 25) or ('g4', 67).
-        """
-        notes = ['c','c#','d','d#','e','f', 'f#', 'g','g#','a','a#','b']
-        octaves = [str(num) for num in range(-1, 10)]
-        octave_notes = [note + octave for octave in octaves for note in notes]
-        return {octave_notes[i]: i for i in range(len(octave_notes))}
-
-    def _create_element_color_dict(self):
-        """
-        Create a dict for looking up the midi note to send to light a
-        controller element, corresponding to the table in the Xone K2 manual.
-        """
-        return {
-            #
-            # top encoder row
-            #
-            'top_encoder_1': {
-                'red': self.note_to_midi['e3'],
-                'orange': self.note_to_midi['e6'],
-                'green': self.note_to_midi['e9'],
-            },
-            'top_encoder_2': {
-                'red': self.note_to_midi['f3'],
-                'orange': self.note_to_midi['f6'],
-                'green': self.note_to_midi['f9'],
-            },
-            'top_encoder_3': {
-                'red': self.note_to_midi['f#3'],
-                'orange': self.note_to_midi['f#6'],
-                'green': self.note_to_midi['f#9'],
-            },
-            'top_encoder_4': {
-                'red': self.note_to_midi['g3'],
-                'orange': self.note_to_midi['g6'],
-                'green': self.note_to_midi['g9'],
-            },
-            #
-            # first pot switches row
-            #
-            'pot_switch_1': {
-                'red': self.note_to_midi['c3'],
-                'orange': self.note_to_midi['c6'],
-                'green': self.note_to_midi['c9'],
-            },
-            'pot_switch_2': {
-                'red': self.note_to_midi['c#3'],
-                'orange': self.note_to_midi['c#6'],
-                'green': self.note_to_midi['c#9'],
-            },
-            'pot_switch_3': {
-                'red': self.note_to_midi['d3'],
-                'orange': self.note_to_midi['d6'],
-                'green': self.note_to_midi['d9'],
-            },
-            'pot_switch_4': {
-                'red': self.note_to_midi['d#3'],
-                'orange': self.note_to_midi['d#6'],
-                'green': self.note_to_midi['d#9'],
-            },
-            #
-            # second pot switches row
-            #
-            'pot_switch_5': {
-                'red': self.note_to_midi['g#2'],
-                'orange': self.note_to_midi['g#5'],
-                'green': self.note_to_midi['g#8'],
-            },
-            'pot_switch_6': {
-                'red': self.note_to_midi['a2'],
-                'orange': self.note_to_midi['a5'],
-                'green': self.note_to_midi['a8'],
-            },
-            'pot_switch_7': {
-                'red': self.note_to_midi['a#2'],
-                'orange': self.note_to_midi['a#5'],
-                'green': self.note_to_midi['a#8'],
-            },
-            'pot_switch_8': {
-                'red': self.note_to_midi['b2'],
-                'orange': self.note_to_midi['b5'],
-                'green': self.note_to_midi['b8'],
-            },
-            #
-            # third pot switches row
-            #
-            'pot_switch_9': {
-                'red': self.note_to_midi['e2'],
-                'orange': self.note_to_midi['e5'],
-                'green': self.note_to_midi['e8'],
-            },
-            'pot_switch_10': {
-                'red': self.note_to_midi['f2'],
-                'orange': self.note_to_midi['f5'],
-                'green': self.note_to_midi['f8'],
-            },
-            'pot_switch_11': {
-                'red': self.note_to_midi['f#2'],
-                'orange': self.note_to_midi['f#5'],
-                'green': self.note_to_midi['f#8'],
-            },
-            'pot_switch_12': {
-                'red': self.note_to_midi['g2'],
-                'orange': self.note_to_midi['g5'],
-                'green': self.note_to_midi['g8'],
-            },
-            #
-            # first matrix row
-            #
-            'matrix_button_a': {
-                'red': self.note_to_midi['c2'],
-                'orange': self.note_to_midi['c5'],
-                'green': self.note_to_midi['c8'],
-            },
-            'matrix_button_b': {
-                'red': self.note_to_midi['c#2'],
-                'orange': self.note_to_midi['c#5'],
-                'green': self.note_to_midi['c#8'],
-            },
-            'matrix_button_c': {
-                'red': self.note_to_midi['d2'],
-                'orange': self.note_to_midi['d5'],
-                'green': self.note_to_midi['d8'],
-            },
-            'matrix_button_d': {
-                'red': self.note_to_midi['d#2'],
-                'orange': self.note_to_midi['d#5'],
-                'green': self.note_to_midi['d#8'],
-            },
-            #
-            # second matrix row
-            #
-            'matrix_button_e': {
-                'red': self.note_to_midi['g#1'],
-                'orange': self.note_to_midi['g#4'],
-                'green': self.note_to_midi['g#7'],
-            },
-            'matrix_button_f': {
-                'red': self.note_to_midi['a1'],
-                'orange': self.note_to_midi['a4'],
-                'green': self.note_to_midi['a7'],
-            },
-            'matrix_button_g': {
-                'red': self.note_to_midi['a#1'],
-                'orange': self.note_to_midi['a#4'],
-                'green': self.note_to_midi['a#7'],
-            },
-            'matrix_button_h': {
-                'red': self.note_to_midi['b1'],
-                'orange': self.note_to_midi['b4'],
-                'green': self.note_to_midi['b7'],
-            },
-            #
-            # third matrix row
-            #
-            'matrix_button_i': {
-                'red': self.note_to_midi['e1'],
-                'orange': self.note_to_midi['e4'],
-                'green': self.note_to_midi['e7'],
-            },
-            'matrix_button_j': {
-                'red': self.note_to_midi['f1'],
-                'orange': self.note_to_midi['f4'],
-                'green': self.note_to_midi['f7'],
-            },
-            'matrix_button_k': {
-                'red': self.note_to_midi['f#1'],
-                'orange': self.note_to_midi['f#4'],
-                'green': self.note_to_midi['f#7'],
-            },
-            'matrix_button_l': {
-                'red': self.note_to_midi['g1'],
-                'orange': self.note_to_midi['g4'],
-                'green': self.note_to_midi['g7'],
-            },
-            #
-            # fourth matrix row
-            #
-            'matrix_button_m': {
-                'red': self.note_to_midi['c1'],
-                'orange': self.note_to_midi['c4'],
-                'green': self.note_to_midi['c7'],
-            },
-            'matrix_button_n': {
-                'red': self.note_to_midi['c#1'],
-                'orange': self.note_to_midi['c#4'],
-                'green': self.note_to_midi['c#7'],
-            },
-            'matrix_button_o': {
-                'red': self.note_to_midi['d1'],
-                'orange': self.note_to_midi['d4'],
-                'green': self.note_to_midi['d7'],
-            },
-            'matrix_button_p': {
-                'red': self.note_to_midi['d#1'],
-                'orange': self.note_to_midi['d#4'],
-                'green': self.note_to_midi['d#7'],
-            },
-            #
-            # bottom row encoder buttons
-            #
-            'layer_button': {
-                'red': self.note_to_midi['c0'],
-                'orange': self.note_to_midi['e0'],
-                'green': self.note_to_midi['g#0'],
-            },
-            'exit_setup_button': {
-                'red': self.note_to_midi['d#0'],
-                'orange': self.note_to_midi['g0'],
-                'green': self.note_to_midi['b0'],
-            }
-        }
-
-
-def find_eq3_device(track):
-    """
-    Tries to find the first 'EQ Three' device on a track.
-
-    track: Track.Track instance to inspect
-    """
-    eq3 = filter(lambda device: device.name == 'EQ Three', track.devices)
-    return eq3[0] if len(eq3) > 0 else None
+        Only the layers that may be lit get a note off on the next flush,
+        unless force_full_wipe makes every layer get one.
 
-def get_eq3_parameter(eq3, param_name):
-    """
-    Tries to find a parameter in a 'EQ Three' device.
-
-    eq3: 'EQ Three' Device.Device instance to inspect.
-    param_name: Name of the parameter to find
-    """
-    parameter = filter(lambda param: param.name == param_name, eq3.parameters)
-    return parameter[0] if len(parameter) > 0 else None
+        force_full_wipe: forget the LED states first, for when the state of
+                         the controller is unknown
+        """
+        if force_full_wipe:
+            self.leds.invalidate()
+        for led in range(self.num_leds):
+            self.leds.set_lit(led, False)
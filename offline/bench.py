@@ -0,0 +1,348 @@
+"""
+Latency benchmark for the Xone K2 remote script, run entirely offline.
+
+Each scenario replays a scripted burst of K2 input (or Live side changes)
+through a fresh Rig and reports, per handler, latency percentiles in
+microseconds along with how many MIDI messages the script sent and how many
+writes it made into Live objects. The startup pseudo scenario times a cold
+import of the script and its construction, and counts the messages of the
+first LED paint.
+
+    python offline/bench.py                      # all scenarios
+    python offline/bench.py startup
+    python offline/bench.py fader_sweep --repeat 20
+    python offline/bench.py --set DISPATCH_MODE=elements
+"""
+from __future__ import print_function
+
+import argparse
+import random
+import subprocess
+import sys
+import time
+
+import fake_live
+import harness
+from harness import Rig
+
+timer = getattr(time, 'perf_counter', time.time)
+
+TICK = None # yielded by scenarios to run one Live display update
+TICK_LABEL = 'update_display'
+
+MUTE_NOTES = [0x1C, 0x1D, 0x1E, 0x1F]
+CUE_NOTES = [0x24, 0x25, 0x26, 0x27]
+EQ_KILL_NOTES = [0x20, 0x21, 0x22, 0x23]
+TRACK_STOP_NOTES = [0x18, 0x19, 0x1A, 0x1B]
+EQ_CUT_NOTES = list(range(0x28, 0x34))
+VOLUME_FADER_CCS = [0x10, 0x11, 0x12, 0x13]
+EQ_KNOB_CCS = list(range(0x04, 0x10))
+SCROBBLE_CCS = [0x00, 0x01, 0x02, 0x03]
+COARSE_TEMPO_CC = 0x14
+FINE_TEMPO_CC = 0x15
+
+
+def fader_sweep(rig, rng):
+    """ All four volume faders swept bottom to top and back, interleaved. """
+    sweep = list(range(128)) + list(range(127, -1, -1))
+    for step, value in enumerate(sweep):
+        for cc in VOLUME_FADER_CCS:
+            yield 'on_volume_fader_move', rig.cc, (cc, value)
+        if step % 4 == 3:
+            yield TICK
+
+
+def eq_twist(rig, rng):
+    """ Random walks on all twelve EQ knobs, several CCs per knob per tick. """
+    positions = dict((cc, 64) for cc in EQ_KNOB_CCS)
+    for step in range(400):
+        cc = rng.choice(EQ_KNOB_CCS)
+        positions[cc] = max(0, min(127, positions[cc] + rng.randint(-3, 3)))
+        yield 'on_eq_knob_turn', rig.cc, (cc, positions[cc])
+        if step % 24 == 23:
+            yield TICK
+
+
+def button_mash(rig, rng):
+    """ Random presses and releases across all the matrix and pot buttons. """
+    labelled_notes = (
+        [('on_mute_button_push', note) for note in MUTE_NOTES] +
+        [('on_cue_button_push', note) for note in CUE_NOTES] +
+        [('on_eq_kill_button_push', note) for note in EQ_KILL_NOTES] +
+        [('on_eq_cut_button_push', note) for note in EQ_CUT_NOTES] +
+        [('on_track_stop_button_push', note) for note in TRACK_STOP_NOTES])
+    for step in range(200):
+        label, note = rng.choice(labelled_notes)
+        yield label, rig.note_on, (note,)
+        yield label, rig.note_off, (note,)
+        if step % 4 == 3:
+            yield TICK
+
+
+def device_churn(rig, rng):
+    """ Devices inserted and deleted on every track, EQ Three included. """
+    for step in range(60):
+        track = rng.choice(rig.tracks)
+        devices = track.devices
+        action = rng.random()
+        if action < 0.4 or not devices:
+            device = fake_live.make_filler_device()
+            index = rng.randint(0, len(devices))
+            rig.seen_devices.append(device)
+            yield ('update_devices_bindings', track.insert_device,
+                   (device, index))
+        elif action < 0.6:
+            device = fake_live.make_eq_three()
+            rig.seen_devices.append(device)
+            yield 'update_devices_bindings', track.insert_device, (device, 0)
+        else:
+            index = rng.randrange(len(devices))
+            yield 'update_devices_bindings', track.delete_device, (index,)
+        yield TICK
+
+
+def long_chain_churn(rig, rng):
+    """ Unrelated devices moving on tracks with 40 device long chains. """
+    for track in rig.tracks:
+        for _ in range(39):
+            track.insert_device(fake_live.make_filler_device(), 0)
+    fake_live.stats.reset() # building the chains is not the script's doing
+    for step in range(60):
+        track = rng.choice(rig.tracks)
+        if step % 2 == 0:
+            device = fake_live.make_filler_device()
+            rig.seen_devices.append(device)
+            index = rng.randint(0, len(track.devices))
+            yield ('update_devices_bindings', track.insert_device,
+                   (device, index))
+        else:
+            filler_indexes = [i for i, d in enumerate(track.devices)
+                              if d.class_name != 'FilterEQ3']
+            index = rng.choice(filler_indexes)
+            yield 'update_devices_bindings', track.delete_device, (index,)
+        yield TICK
+
+
+def bank_paging(rig, rng):
+    """ Paging the strips back and forth through a 100 track set. """
+    rig.note_on(0x0E) # hold the fine tempo encoder to page
+    for step in range(100):
+        value = 1 if (step // 25) % 2 == 0 else 127
+        yield 'page_tracks', rig.cc, (COARSE_TEMPO_CC, value)
+        yield TICK
+    rig.note_off(0x0E)
+
+bank_paging.num_tracks = 100
+
+
+def track_list_churn(rig, rng):
+    """ Tracks added, removed and reordered in the Live set. """
+    for step in range(60):
+        tracks = list(rig.song.visible_tracks)
+        action = rng.random()
+        if action < 0.3 or len(tracks) < 2:
+            track = fake_live.Track('New %d' % step)
+            tracks.insert(rng.randint(0, len(tracks)), track)
+        elif action < 0.6:
+            del tracks[rng.randrange(len(tracks))]
+        else:
+            i, j = rng.randrange(len(tracks)), rng.randrange(len(tracks))
+            tracks[i], tracks[j] = tracks[j], tracks[i]
+        yield ('update_track_bank', setattr,
+               (rig.song, 'visible_tracks', tracks))
+        yield TICK
+
+track_list_churn.num_tracks = 12
+
+
+def tempo_spin(rig, rng):
+    """ Fast spins on both tempo encoders, in both directions. """
+    for step in range(240):
+        cc = COARSE_TEMPO_CC if (step // 60) % 2 == 0 else FINE_TEMPO_CC
+        value = 1 if (step // 30) % 2 == 0 else 127
+        label = ('on_coarse_tempo_change' if cc == COARSE_TEMPO_CC
+                 else 'on_fine_tempo_change')
+        yield label, rig.cc, (cc, value)
+        if step % 12 == 11:
+            yield TICK
+
+
+def scrobble_spin(rig, rng):
+    """ Scrobble encoders spun back and forth on tracks playing a clip. """
+    for track in rig.tracks:
+        track.playing_slot_index = 0
+    fake_live.stats.reset() # starting the clips is not the script's doing
+    for step in range(240):
+        cc = SCROBBLE_CCS[step % len(SCROBBLE_CCS)]
+        value = 1 if (step // 40) % 2 == 0 else 127
+        yield 'on_scrobble_change', rig.cc, (cc, value)
+        if step % 16 == 15:
+            yield TICK
+
+
+def beat_playback(rig, rng):
+    """ The song playing with clips on every track and two tracks cued. """
+    for track in rig.tracks:
+        track.playing_slot_index = 0
+    rig.press(0x24)
+    rig.press(0x26)
+    rig.song.is_playing = True
+    fake_live.stats.reset() # starting the song is not the script's doing
+
+    def advance(song_time):
+        # Live moving the song position isn't a write by the script
+        object.__setattr__(rig.song, 'current_song_time', song_time)
+        rig.song.notify('current_song_time')
+
+    for step in range(640):
+        yield 'on_song_time_change', advance, (step / 32.0,)
+        if step % 8 == 7:
+            yield TICK
+
+
+SCENARIOS = [
+    fader_sweep, eq_twist, button_mash, device_churn, long_chain_churn,
+    bank_paging, track_list_churn, tempo_spin, scrobble_spin, beat_playback,
+]
+
+# (name, function of rig) pairs reported for every scenario run.
+COUNTERS = [
+    ('send_midi', lambda rig: len(rig.c_instance.sent_midi)),
+    ('live_writes', lambda rig: fake_live.stats.live_writes),
+    ('live_reads', lambda rig: fake_live.stats.live_reads),
+    ('led_sends_skipped', lambda rig: rig.script.leds.skipped_count),
+    ('live_writes_saved',
+     lambda rig: rig.script.parameter_writes.saved_count),
+    ('listener_growth',
+     lambda rig: fake_live.count_listeners(rig.song, rig.seen_devices)),
+]
+
+
+IMPORT_SNIPPET = '''
+import sys, time
+sys.path.insert(0, %r)
+timer = getattr(time, 'perf_counter', time.time)
+import harness
+start = timer()
+harness.load_script_package()
+print(timer() - start)
+'''
+
+
+def startup(result, repeat, settings={}):
+    """
+    Time a cold import of the script package, each in a fresh interpreter,
+    and the construction of the script through create_instance.
+    """
+    snippet = IMPORT_SNIPPET % harness.OFFLINE_DIR
+    for run in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', snippet])
+        result.add_sample('import', float(output.decode().split()[-1]))
+    for run in range(repeat * 10):
+        song = fake_live.make_song(4)
+        start = timer()
+        rig = Rig.build(song=song, **settings)
+        result.add_sample('create_instance', timer() - start)
+        result.events = 1
+        for name, counter in COUNTERS:
+            result.counters[name] = counter(rig)
+        rig.disconnect()
+
+
+def percentile(sorted_samples, fraction):
+    index = int(round(fraction * (len(sorted_samples) - 1)))
+    return sorted_samples[index]
+
+
+class Result(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = {}
+        self.counters = {}
+        self.events = 0
+        self.ticks = 0
+
+    def add_sample(self, label, seconds):
+        self.samples.setdefault(label, []).append(seconds * 1e6)
+
+    def report(self):
+        lines = ['%s: %d events, %d ticks' % (
+            self.name, self.events, self.ticks)]
+        lines.append('  ' + ', '.join(
+            '%s %d' % (name, self.counters[name]) for name, _ in COUNTERS))
+        lines.append('  %-28s %7s %8s %8s %8s %8s' % (
+            'handler', 'calls', 'p50 us', 'p90 us', 'p99 us', 'max us'))
+        for label in sorted(self.samples):
+            samples = sorted(self.samples[label])
+            lines.append('  %-28s %7d %8.1f %8.1f %8.1f %8.1f' % (
+                label, len(samples), percentile(samples, 0.5),
+                percentile(samples, 0.9), percentile(samples, 0.99),
+                samples[-1]))
+        return '\n'.join(lines)
+
+
+def run_scenario(scenario, result, seed=0, settings={}):
+    """
+    Run one scenario on a fresh rig. Latency samples are added to the ones
+    already in `result`, event and tick counts and counters are per run.
+    """
+    rig = Rig.build(getattr(scenario, 'num_tracks', 4), **settings)
+    rig.clear_counters()
+    baseline = dict((name, counter(rig)) for name, counter in COUNTERS)
+    result.events = result.ticks = 0
+    for event in scenario(rig, random.Random(seed)):
+        if event is TICK:
+            start = timer()
+            rig.tick()
+            result.add_sample(TICK_LABEL, timer() - start)
+            result.ticks += 1
+            continue
+        label, action, args = event
+        start = timer()
+        action(*args)
+        result.add_sample(label, timer() - start)
+        result.events += 1
+    start = timer()
+    rig.tick()
+    result.add_sample(TICK_LABEL, timer() - start)
+    for name, counter in COUNTERS:
+        result.counters[name] = counter(rig) - baseline[name]
+    rig.disconnect()
+    return rig
+
+
+def main(argv=None):
+    names = ['startup'] + [scenario.__name__ for scenario in SCENARIOS]
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='one of %s, default all' % ', '.join(names))
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs per scenario, latency samples are pooled')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='override a XoneK2.py setting, '
+                             'e.g. --set DISPATCH_MODE=elements')
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in names:
+            parser.error('unknown scenario %r' % name)
+    settings = harness.parse_settings(args.set)
+    if not args.scenarios or 'startup' in args.scenarios:
+        result = Result('startup')
+        startup(result, args.repeat, settings)
+        print(result.report())
+        print()
+    for scenario in SCENARIOS:
+        if args.scenarios and scenario.__name__ not in args.scenarios:
+            continue
+        result = Result(scenario.__name__)
+        for run in range(args.repeat):
+            run_scenario(scenario, result, args.seed, settings)
+        print(result.report())
+        print()
+
+
+if __name__ == '__main__':
+    main()
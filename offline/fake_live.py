@@ -0,0 +1,253 @@
+"""
+Fake Live object model (Song, Track, Device, ...) for driving the script
+offline.
+
+Every write to a public property, and every read of an observable one, is
+counted in `stats`, since each of those is a call into Live when the script
+runs for real. Observable properties notify their listeners synchronously
+when the written value changes, like Live does for mute, solo, device lists
+and parameter values.
+"""
+from functools import partial
+
+EQ_THREE_PARAMETERS = [
+    ('Device On', 1.0), ('GainLo', 0.85), ('GainMid', 0.85),
+    ('GainHi', 0.85), ('FreqLo', 0.5), ('FreqHi', 0.5),
+    ('LowOn', 1.0), ('MidOn', 1.0), ('HighOn', 1.0), ('Slope', 0.0)]
+
+
+class Stats(object):
+    """ Counters shared by all fake Live objects. """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.live_writes = 0
+        self.live_reads = 0
+        self.notifications = 0
+
+
+stats = Stats()
+
+
+class LiveObject(object):
+    """
+    Base class providing Live style add_/remove_/_has_listener methods for
+    every name in `observables`, write counting for public properties and
+    read counting for observable ones.
+    """
+    observables = ()
+
+    def __init__(self, **properties):
+        object.__setattr__(self, '_listeners', {})
+        for name, value in properties.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+            return
+        stats.live_writes += 1
+        old_value = self.__dict__.get(name)
+        object.__setattr__(self, name, value)
+        if name in self.observables and old_value != value:
+            self.notify(name)
+
+    def __getattribute__(self, name):
+        if name in type(self).observables:
+            stats.live_reads += 1
+        return object.__getattribute__(self, name)
+
+    def __getattr__(self, name):
+        method = None
+        for prefix, action in (('add_', self._add_listener),
+                               ('remove_', self._remove_listener)):
+            if name.startswith(prefix) and name.endswith('_listener'):
+                event = name[len(prefix):-len('_listener')]
+                if event in self.observables:
+                    method = partial(action, event)
+        if name.endswith('_has_listener'):
+            event = name[:-len('_has_listener')]
+            if event in self.observables:
+                method = partial(self._has_listener, event)
+        if method is None:
+            raise AttributeError(name)
+        # Cache the method so later lookups don't come through here
+        object.__setattr__(self, name, method)
+        return method
+
+    def listeners(self, event):
+        return self._listeners.setdefault(event, [])
+
+    def listener_count(self):
+        return sum(len(listeners) for listeners in self._listeners.values())
+
+    def _add_listener(self, event, listener):
+        listeners = self.listeners(event)
+        if listener in listeners:
+            raise RuntimeError('Listener already connected')
+        listeners.append(listener)
+
+    def _has_listener(self, event, listener):
+        return listener in self.listeners(event)
+
+    def _remove_listener(self, event, listener):
+        listeners = self.listeners(event)
+        if listener not in listeners:
+            raise RuntimeError('Listener not connected')
+        listeners.remove(listener)
+
+    def notify(self, event):
+        for listener in list(self.listeners(event)):
+            stats.notifications += 1
+            listener()
+
+
+class DeviceParameter(LiveObject):
+    observables = ('value',)
+
+    def __init__(self, name, value=0.0, min=0.0, max=1.0):
+        super(DeviceParameter, self).__init__(
+            name=name, value=value, min=min, max=max)
+
+
+class Device(LiveObject):
+    observables = ('parameters', 'name')
+
+    def __init__(self, name, class_name, parameters=()):
+        super(Device, self).__init__(
+            name=name, class_name=class_name, parameters=list(parameters))
+
+
+class MixerDevice(LiveObject):
+
+    def __init__(self):
+        super(MixerDevice, self).__init__(
+            volume=DeviceParameter('Track Volume', 0.85),
+            panning=DeviceParameter('Track Panning', 0.0, -1.0, 1.0))
+
+
+class Clip(LiveObject):
+    observables = ('position', 'playing_position')
+
+    def __init__(self, length=16.0):
+        super(Clip, self).__init__(
+            length=length, position=0.0, playing_position=0.0, looping=True)
+
+
+class ClipSlot(LiveObject):
+    observables = ('has_clip',)
+
+    def __init__(self, clip=None):
+        super(ClipSlot, self).__init__(clip=clip, has_clip=clip is not None)
+
+
+class Track(LiveObject):
+    observables = ('mute', 'solo', 'devices', 'playing_slot_index',
+                   'fired_slot_index', 'name')
+
+    def __init__(self, name, num_scenes=8):
+        super(Track, self).__init__(
+            name=name, mute=False, solo=False, devices=[],
+            mixer_device=MixerDevice(),
+            clip_slots=[ClipSlot(Clip()) for _ in range(num_scenes)],
+            playing_slot_index=-1, fired_slot_index=-1)
+        self._stop_count = 0
+
+    def stop_all_clips(self, Quantized=True):
+        self._stop_count += 1
+        self.playing_slot_index = -1
+
+    def insert_device(self, device, index=None):
+        devices = list(self.devices)
+        devices.insert(len(devices) if index is None else index, device)
+        self.devices = devices
+
+    def delete_device(self, index):
+        devices = list(self.devices)
+        del devices[index]
+        self.devices = devices
+
+
+class Song(LiveObject):
+    observables = ('tempo', 'visible_tracks', 'tracks', 'is_playing',
+                   'current_song_time', 'nudge_up', 'nudge_down')
+
+    def __init__(self, tracks):
+        super(Song, self).__init__(
+            tempo=120.0, nudge_up=False, nudge_down=False, is_playing=False,
+            current_song_time=0.0, signature_numerator=4,
+            signature_denominator=4, tracks=list(tracks),
+            visible_tracks=list(tracks))
+
+
+def count_listeners(song, devices=()):
+    """
+    Count the listeners connected to a song, its tracks and their devices,
+    mixers and clips. Devices removed from their track are only counted if
+    passed in `devices`, since a leaked listener keeps them alive.
+    """
+    objects = [song]
+    for track in song.tracks:
+        objects += [track, track.mixer_device, track.mixer_device.volume]
+        objects += track.clip_slots
+        objects += [slot.clip for slot in track.clip_slots if slot.clip]
+        objects += track.devices
+    objects += [device for device in devices if device not in objects]
+    for device in list(objects):
+        if isinstance(device, Device):
+            objects += device.parameters
+    return sum(o.listener_count() for o in objects)
+
+
+def make_eq_three(name='EQ Three'):
+    """ Create a fake 'EQ Three' device with Live's parameter names. """
+    parameters = [DeviceParameter(n, v) for n, v in EQ_THREE_PARAMETERS]
+    return Device(name, 'FilterEQ3', parameters)
+
+
+def make_eq_eight(name='EQ Eight'):
+    """ Create a fake 'EQ Eight' device with Live's parameter names. """
+    parameters = [DeviceParameter('Device On', 1.0)]
+    for band in range(1, 9):
+        parameters += [
+            DeviceParameter('%d Filter On A' % band, 1.0),
+            DeviceParameter('%d Filter Type A' % band, 3.0, 0.0, 7.0),
+            DeviceParameter('%d Frequency A' % band, 0.5),
+            DeviceParameter('%d Gain A' % band, 0.0, -15.0, 15.0),
+            DeviceParameter('%d Resonance A' % band, 0.3)]
+    parameters += [DeviceParameter('Output Gain', 0.0, -12.0, 12.0),
+                   DeviceParameter('Scale', 1.0, -2.0, 2.0),
+                   DeviceParameter('Adaptive Q', 1.0)]
+    return Device(name, 'Eq8', parameters)
+
+
+def make_rack(name='Audio Effect Rack', macro_names=()):
+    """
+    Create a fake audio effect rack, with its first macros named as given
+    and the rest left at their default names.
+    """
+    names = list(macro_names)
+    names += ['Macro %d' % i for i in range(len(names) + 1, 9)]
+    parameters = [DeviceParameter('Device On', 1.0)] + [
+        DeviceParameter(name, 63.5, 0.0, 127.0) for name in names]
+    return Device(name, 'AudioEffectGroupDevice', parameters)
+
+
+def make_filler_device(name='Utility', num_parameters=8):
+    """ Create a fake device the script should not care about. """
+    parameters = [DeviceParameter('Device On', 1.0)] + [
+        DeviceParameter('Param %d' % i) for i in range(num_parameters)]
+    return Device(name, 'StereoGain', parameters)
+
+
+def make_song(num_tracks=4, with_eq3=True):
+    """ Create a song with `num_tracks` tracks, each with an EQ Three. """
+    tracks = []
+    for i in range(num_tracks):
+        track = Track('%d Audio' % (i + 1))
+        if with_eq3:
+            object.__setattr__(track, 'devices', [make_eq_three()])
+        tracks.append(track)
+    return Song(tracks)
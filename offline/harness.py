@@ -0,0 +1,170 @@
+"""
+Offline simulation harness for the Xone K2 remote script.
+
+Puts the stand-ins in offline/stubs on the import path, loads the script the
+way Live does (through create_instance in the package __init__.py) and wires
+it to a fake c_instance and a fake Song from fake_live.
+
+    rig = Rig.build(num_tracks=4)
+    rig.cc(0x10, 127)       # move the first volume fader to the top
+    rig.note_on(0x1C)       # push the first mute button
+    rig.tick()              # let Live run one display update
+"""
+import ast
+import os
+import sys
+
+OFFLINE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(OFFLINE_DIR)
+STUBS_DIR = os.path.join(OFFLINE_DIR, 'stubs')
+
+for _path in (SCRIPT_DIR, STUBS_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+import fake_live
+
+NOTE_ON = 0x90
+NOTE_OFF = 0x80
+CC = 0xB0
+
+
+def load_script_package():
+    """ Import the script's __init__.py under the name Live would use. """
+    name = 'XoneK2_MIDI_Remote_Script'
+    module = sys.modules.get(name)
+    if module is None:
+        path = os.path.join(SCRIPT_DIR, '__init__.py')
+        try:
+            from importlib.util import module_from_spec
+            from importlib.util import spec_from_file_location
+        except ImportError:
+            import imp
+            return imp.load_source(name, path)
+        spec = spec_from_file_location(name, path)
+        module = module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[name] = module
+    return module
+
+
+def parse_settings(assignments):
+    """
+    Parse NAME=VALUE command line overrides of XoneK2.py settings into a
+    dict for Rig.build. Values are Python literals, or else strings.
+    """
+    settings = {}
+    for assignment in assignments:
+        name, _, value = assignment.partition('=')
+        try:
+            settings[name] = ast.literal_eval(value)
+        except (SyntaxError, ValueError):
+            settings[name] = value
+    return settings
+
+
+class FakeCInstance(object):
+    """ Records everything the script sends back to Live or the K2. """
+
+    def __init__(self, song):
+        self._song = song
+        self.sent_midi = []
+        self.log = []
+        self.messages = []
+        self.rebuild_requests = 0
+
+    def song(self):
+        return self._song
+
+    def send_midi(self, midi_bytes):
+        self.sent_midi.append(midi_bytes)
+
+    def log_message(self, message):
+        self.log.append(message)
+
+    def show_message(self, message):
+        self.messages.append(message)
+
+    def request_rebuild_midi_map(self):
+        self.rebuild_requests += 1
+
+    def instance_identifier(self):
+        return 0
+
+
+class Rig(object):
+    """ A script instance together with the fake Live it is talking to. """
+
+    def __init__(self, song, c_instance, script):
+        self.song = song
+        self.c_instance = c_instance
+        self.script = script
+        self.ticks = 0
+        self.seen_devices = [d for t in song.tracks for d in t.devices]
+
+    @classmethod
+    def build(cls, num_tracks=4, with_eq3=True, song=None, **settings):
+        """
+        Create a script instance on a new fake song.
+
+        settings: module constants of XoneK2.py to override while the
+                  script is constructed, e.g. DISPATCH_MODE='elements'
+        """
+        if song is None:
+            song = fake_live.make_song(num_tracks, with_eq3)
+        c_instance = FakeCInstance(song)
+        package = load_script_package()
+        script_module = sys.modules['XoneK2']
+        defaults = dict((name, getattr(script_module, name))
+                        for name in settings)
+        for name, value in settings.items():
+            setattr(script_module, name, value)
+        try:
+            script = package.create_instance(c_instance)
+        finally:
+            for name, value in defaults.items():
+                setattr(script_module, name, value)
+        return cls(song, c_instance, script)
+
+    @property
+    def tracks(self):
+        return self.song.visible_tracks
+
+    def send(self, status, number, value, unit=0):
+        channel = self.script.unit_channels[unit]
+        self.script.receive_midi((status + channel, number, value))
+
+    def note_on(self, note, velocity=127, unit=0):
+        self.send(NOTE_ON, note, velocity, unit)
+
+    def note_off(self, note, unit=0):
+        self.send(NOTE_OFF, note, 0, unit)
+
+    def press(self, note, unit=0):
+        self.note_on(note, unit=unit)
+        self.note_off(note, unit)
+
+    def cc(self, number, value, unit=0):
+        self.send(CC, number, value, unit)
+
+    def tick(self):
+        self.ticks += 1
+        self.script.update_display()
+
+    def settle(self):
+        """
+        Tick until the LED changes queued so far are all sent, e.g. the
+        first paint of the surface. Returns the number of ticks it took.
+        """
+        ticks = 0
+        while self.script.leds.pending_count:
+            self.tick()
+            ticks += 1
+        return ticks
+
+    def clear_counters(self):
+        del self.c_instance.sent_midi[:]
+        fake_live.stats.reset()
+
+    def disconnect(self):
+        self.script.disconnect()
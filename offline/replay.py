@@ -0,0 +1,100 @@
+"""
+Replay a midi recording of the Xone K2 remote script offline.
+
+Record a set by pointing MIDI_RECORDING_PATH in XoneK2.py at a file. The
+incoming midi and display ticks of a recorded session are then driven
+through a fresh Rig, either as fast as possible or with their original
+timing, and the handler instrumentation of the replay is printed.
+
+    python offline/replay.py show.k2rec                  # last session
+    python offline/replay.py show.k2rec --session 0 --realtime
+    python offline/replay.py show.k2rec --tracks 8 --set DISPATCH_MODE=elements
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import fake_live
+import harness
+from harness import Rig
+from MidiRecorder import read_recording
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def replay(rig, events, realtime=False, sleep=time.sleep):
+    """
+    Drive recorded events through a rig.
+
+    The tempo encoders of the script read the recorded time of the events
+    instead of the real clock, so their acceleration is the same as in the
+    recording, also when replaying as fast as possible.
+
+    events:   (seconds, midi bytes) tuples of a session, where the midi
+              bytes of a display tick are None
+    realtime: wait for the original time of every event, instead of
+              replaying as fast as possible
+    """
+    now = [0.0]
+    clock = lambda: now[0]
+    script = rig.script
+    for accumulator in (script.coarse_tempo_detents,
+                        script.fine_tempo_detents):
+        accumulator._clock = clock
+    start = timer()
+    for seconds, midi_bytes in events:
+        now[0] = seconds
+        if realtime:
+            delay = start + seconds - timer()
+            if delay > 0:
+                sleep(delay)
+        if midi_bytes is None:
+            rig.tick()
+        else:
+            rig.script.receive_midi(midi_bytes)
+    return timer() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('recording', help='file written by a MidiRecorder')
+    parser.add_argument('--session', type=int, default=-1,
+                        help='index of the session to replay, default last')
+    parser.add_argument('--realtime', action='store_true',
+                        help='replay with the original timing')
+    parser.add_argument('--tracks', type=int, default=4,
+                        help='number of tracks of the fake song')
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='override a XoneK2.py setting, '
+                             'e.g. --set DISPATCH_MODE=elements')
+    args = parser.parse_args(argv)
+    sessions = read_recording(args.recording)
+    if not sessions:
+        parser.error('%s has no sessions' % args.recording)
+    events = sessions[args.session]
+    settings = harness.parse_settings(args.set)
+    settings.setdefault('INSTRUMENTATION', True)
+    settings.setdefault('INSTRUMENTATION_DUMP_INTERVAL', None)
+    settings['MIDI_RECORDING_PATH'] = None
+    rig = Rig.build(num_tracks=args.tracks, **settings)
+    rig.clear_counters()
+    if rig.script.instrumentation is not None:
+        rig.script.instrumentation.reset()
+    elapsed = replay(rig, events, args.realtime)
+    messages = sum(1 for _, midi_bytes in events if midi_bytes is not None)
+    print('session %d of %d: %d messages, %d ticks, %.1f s recorded, '
+          '%.3f s replayed'
+          % (args.session % len(sessions), len(sessions), messages,
+             len(events) - messages, events[-1][0] if events else 0.0,
+             elapsed))
+    print('send_midi %d, live_writes %d'
+          % (len(rig.c_instance.sent_midi), fake_live.stats.live_writes))
+    if rig.script.instrumentation is not None:
+        for line in rig.script.instrumentation.summary():
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,841 @@
+"""
+Correctness checks for the optimizations in the script, run offline.
+
+Every function named check_* is run in order; a failing check raises an
+AssertionError with a description of what went wrong.
+
+    python offline/selfcheck.py
+"""
+from __future__ import print_function
+
+import sys
+import traceback
+
+import harness
+
+NORMALIZED_ZERO_DB = 0.85000002384185791015625
+
+
+def reference_volume_fader_value(value):
+    """ The per message volume formula as it was before the curve tables """
+    normalized_fader_value = (value + 1.0) / 128.0
+    new_volume = normalized_fader_value * NORMALIZED_ZERO_DB
+    return new_volume
+
+
+def reference_eq_knob_value(value):
+    """ The per message EQ gain formula as it was before the curve tables """
+    normalized_knob_value = (value + 1.0) / 128.0
+    dead_zone_x_range = 0.1
+    lower_x_range = 0.5 - dead_zone_x_range / 2
+    lower_y_max = NORMALIZED_ZERO_DB
+    upper_x_range = 0.5 + dead_zone_x_range / 2
+    upper_y_range = 1.0 - lower_y_max
+    if normalized_knob_value <= lower_x_range:
+        scaled_knob_value = normalized_knob_value / lower_x_range
+        new_gain_value = scaled_knob_value * lower_y_max
+    elif normalized_knob_value <= (lower_x_range + dead_zone_x_range):
+        new_gain_value = NORMALIZED_ZERO_DB
+    else:
+        shifted_knob_value = normalized_knob_value - lower_x_range
+        scaled_knob_value = shifted_knob_value / upper_x_range
+        upper_y_value = scaled_knob_value * upper_y_range
+        new_gain_value = lower_y_max + upper_y_value
+    return new_gain_value
+
+
+def check_curve_tables_match_formulas():
+    import ResponseCurves
+    assert ResponseCurves.NORMALIZED_ZERO_DB == NORMALIZED_ZERO_DB
+    for value in range(128):
+        expected = reference_volume_fader_value(value)
+        actual = ResponseCurves.VOLUME_FADER_CURVE[value]
+        assert actual == expected, 'volume %d: %r != %r' % (
+            value, actual, expected)
+        expected = reference_eq_knob_value(value)
+        actual = ResponseCurves.EQ_KNOB_CURVE[value]
+        assert actual == expected, 'eq gain %d: %r != %r' % (
+            value, actual, expected)
+
+
+def check_handlers_write_curve_values():
+    rig = harness.Rig.build()
+    volume = rig.tracks[0].mixer_device.volume
+    gain_hi = [p for p in rig.tracks[1].devices[0].parameters
+               if p.name == 'GainHi'][0]
+    for value in range(128):
+        rig.cc(0x10, value)
+        rig.cc(0x05, value)
+        rig.tick()
+        assert volume.value == reference_volume_fader_value(value)
+        assert gain_hi.value == reference_eq_knob_value(value)
+
+
+def check_custom_curves_replace_tables():
+    import ResponseCurves
+    rig = harness.Rig.build()
+    wide = ResponseCurves.build_curve_table(
+        lambda value: ResponseCurves.eq_knob_value(value, 0.3))
+    rig.script.set_response_curves(
+        volume_curve=ResponseCurves.build_curve_table(
+            ResponseCurves.log_taper_fader_value),
+        eq_curve=wide)
+    rig.cc(0x10, 127)
+    rig.cc(0x05, 48)
+    rig.tick()
+    volume = rig.tracks[0].mixer_device.volume.value
+    assert abs(volume - NORMALIZED_ZERO_DB) < 1e-9, volume
+    gain_hi = [p for p in rig.tracks[1].devices[0].parameters
+               if p.name == 'GainHi'][0]
+    assert gain_hi.value == NORMALIZED_ZERO_DB, gain_hi.value
+    for bad_table in ([0.5] * 127, [2.0] * 128):
+        try:
+            rig.script.set_response_curves(eq_curve=bad_table)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('invalid curve table accepted')
+
+
+def check_fader_bursts_are_coalesced():
+    rig = harness.Rig.build()
+    volume = rig.tracks[2].mixer_device.volume
+    rig.clear_counters()
+    for value in range(100):
+        rig.cc(0x12, value)
+    assert volume.value == reference_volume_fader_value(0)
+    rig.tick()
+    assert volume.value == reference_volume_fader_value(99)
+    assert harness.fake_live.stats.live_writes == 2
+    assert rig.script.parameter_writes.saved_count == 98
+
+
+def check_tempo_detents_are_accumulated_and_accelerated():
+    rig = harness.Rig.build()
+    now = [0.0]
+    for accumulator in (rig.script.coarse_tempo_detents,
+                        rig.script.fine_tempo_detents):
+        accumulator._clock = lambda: now[0]
+    # Slow turns of the pushed fine encoder keep 0.01 BPM precision
+    rig.note_on(0x0E)
+    for _ in range(3):
+        now[0] += 0.5
+        rig.cc(0x15, 1)
+        rig.tick()
+    assert rig.song.tempo == 120.03, rig.song.tempo
+    rig.note_off(0x0E)
+    # A fast spin is accelerated and written once per tick
+    rig.clear_counters()
+    for _ in range(20):
+        now[0] += 0.002
+        rig.cc(0x14, 1)
+    rig.tick()
+    assert harness.fake_live.stats.live_writes == 1
+    assert rig.song.tempo > 120.03 + 20, rig.song.tempo
+    # Detents the clock can't tell apart keep the speed of the previous two
+    accumulator = rig.script.coarse_tempo_detents
+    accumulator.take()
+    for interval in (0.5, 0.015, 0.0, 0.0):
+        now[0] += interval
+        accumulator.add_detent(1.0)
+    delta = accumulator.take()
+    assert delta == 1.0 + 2.0 * 3, delta
+    now[0] += 0.5
+    for _ in range(3):
+        accumulator.add_detent(-1.0)
+    assert accumulator.take() == -3.0
+    # Tempo stays within Live's range
+    for _ in range(200):
+        now[0] += 0.002
+        rig.cc(0x14, 127)
+    rig.tick()
+    assert rig.song.tempo == 20.0, rig.song.tempo
+
+
+def check_listener_count_stays_flat_under_device_churn():
+    rig = harness.Rig.build()
+    registry = rig.script.listener_registry
+    live_count = registry.live_count
+    song_listeners = harness.fake_live.count_listeners(rig.song)
+    for _ in range(50):
+        for track in rig.tracks:
+            track.insert_device(harness.fake_live.make_filler_device(), 0)
+            track.insert_device(harness.fake_live.make_eq_three(), 0)
+            track.delete_device(2)
+            track.delete_device(1)
+    assert registry.live_count == live_count
+    assert harness.fake_live.count_listeners(rig.song) == song_listeners
+    assert registry.total_count > live_count
+    rig.disconnect()
+    assert registry.live_count == 0
+    assert harness.fake_live.count_listeners(rig.song) == 0
+
+
+def check_unrelated_device_changes_keep_eq3_binding():
+    rig = harness.Rig.build()
+    registry = rig.script.listener_registry
+    track = rig.tracks[3]
+    eq3 = track.devices[0]
+    total_count = registry.total_count
+    track.insert_device(harness.fake_live.make_filler_device(), 0)
+    track.delete_device(0)
+    assert registry.total_count == total_count
+    assert rig.script.eq_devices[3] is eq3
+    # Binding a new EQ Three resolves all its parameters
+    new_eq3 = harness.fake_live.make_eq_three()
+    track.insert_device(new_eq3, 0)
+    names = [param.name for param in new_eq3.parameters]
+    assert rig.script.eq_devices[3] is new_eq3
+    assert rig.script.eq_low_gain_params[3] is new_eq3.parameters[
+        names.index('GainLo')]
+    assert rig.script.eq_hi_cut_params[3] is new_eq3.parameters[
+        names.index('HighOn')]
+
+
+def check_strips_follow_visible_tracks_and_bank():
+    rig = harness.Rig.build(num_tracks=2)
+    script = rig.script
+    assert script.tracks[2:] == [None, None]
+    for note in (0x1E, 0x26, 0x1A, 0x22):
+        rig.press(note)
+    rig.cc(0x12, 100)
+    rig.cc(0x01, 1)
+    rig.tick()
+    # Adding tracks binds them to the free strips only
+    registry = script.listener_registry
+    total_count = registry.total_count
+    tracks = list(rig.song.visible_tracks)
+    new_tracks = [harness.fake_live.Track('New %d' % i) for i in range(7)]
+    rig.song.visible_tracks = tracks + new_tracks
+    assert script.tracks == tracks + new_tracks[:2]
+    assert registry.total_count - total_count == 2 * 4
+    # Paging moves the bank by a page, and stops at the last one
+    rig.note_on(0x0E)
+    for _ in range(3):
+        rig.cc(0x14, 1)
+    rig.note_off(0x0E)
+    assert script.bank_offset == 8
+    assert script.tracks == new_tracks[6:] + [None] * 3
+    tempo = rig.song.tempo
+    rig.tick()
+    assert rig.song.tempo == tempo
+    # Removing tracks falls back to the last bank with tracks
+    rig.song.visible_tracks = tracks + new_tracks[:3]
+    assert script.bank_offset == 4
+    assert script.tracks == new_tracks[2:3] + [None] * 3
+    rig.cc(0x10, 100)
+    rig.tick()
+    assert new_tracks[2].mixer_device.volume.value == \
+        reference_volume_fader_value(100)
+
+
+def check_dispatch_modes_behave_the_same():
+    outcomes = []
+    for mode in ('elements', 'table'):
+        rig = harness.Rig.build(DISPATCH_MODE=mode)
+        assert (rig.script.midi_dispatch is None) == (mode == 'elements')
+        for note in range(0x0C, 0x38):
+            rig.press(note)
+            rig.tick()
+        for cc in range(0x00, 0x16):
+            rig.cc(cc, 1)
+            rig.cc(cc, 90)
+            rig.tick()
+        state = [(t.mute, t.solo, t.mixer_device.volume.value,
+                  [p.value for p in t.devices[0].parameters])
+                 for t in rig.tracks]
+        outcomes.append((rig.c_instance.sent_midi, state))
+    assert outcomes[0] == outcomes[1]
+
+
+def check_led_reset_sends_only_what_is_needed():
+    import LedTable
+    rig = harness.Rig.build(num_tracks=4)
+    off_messages = set(rig.script.leds._off_messages)
+    # The wipe is drained over ticks, in bursts the K2 can take
+    burst = rig.script.leds.max_sends
+    assert burst < LedTable.NUM_LEDS
+    assert len(rig.c_instance.sent_midi) == burst
+    ticks = rig.settle()
+    assert ticks == (LedTable.NUM_LEDS - 1) // burst, ticks
+    assert len(rig.c_instance.sent_midi) == LedTable.NUM_LEDS
+    lit = [led for led in range(LedTable.NUM_LEDS)
+           if rig.script.leds.is_lit(led)]
+    rig.clear_counters()
+    rig.script.refresh_state()
+    assert len(rig.c_instance.sent_midi) == burst
+    rig.settle()
+    assert len(rig.c_instance.sent_midi) == LedTable.NUM_LEDS
+    rig.clear_counters()
+    rig.script.resync()
+    assert rig.c_instance.sent_midi == [], 'resync resent known LEDs'
+    rig.clear_counters()
+    rig.disconnect()
+    assert len(rig.c_instance.sent_midi) == len(lit), '%d != %d' % (
+        len(rig.c_instance.sent_midi), len(lit))
+    assert set(rig.c_instance.sent_midi) <= off_messages
+
+
+def check_instrumentation_counts_without_changing_behaviour():
+    outcomes = []
+    for enabled in (False, True):
+        rig = harness.Rig.build(num_tracks=4, INSTRUMENTATION=enabled)
+        rig.clear_counters()
+        for value in range(0, 128, 8):
+            rig.cc(0x10, value)
+            rig.cc(0x04, value)
+        rig.press(0x1C)
+        rig.press(0x30)
+        rig.cc(0x14, 1)
+        rig.tick()
+        outcomes.append(rig.c_instance.sent_midi)
+    assert outcomes[0] == outcomes[1]
+    instrumentation = rig.script.instrumentation
+    calls, total, longest, writes, requests, sends = (
+        instrumentation.counters('on_volume_fader_move'))
+    assert calls == 16 and 0.0 < longest <= total, (calls, total, longest)
+    midi_writes = instrumentation.counters('receive_midi')[3]
+    tick_writes = instrumentation.counters('update_display')[3]
+    assert midi_writes + tick_writes == harness.fake_live.stats.live_writes
+    assert instrumentation.counters('update_display')[5] == len(outcomes[1])
+    # Handlers are charged for the LED changes they request, the flush in
+    # update_display for sending them
+    assert instrumentation.counters('on_mute_button_push')[4] > 0
+    assert instrumentation.counters('draw_mute_button')[4] > 0
+    assert instrumentation.counters('on_mute_button_push')[5] == 0
+    for name in ('resync', 'draw_all_elements', 'draw_animated_led',
+                 'draw_mute_button', 'commit_tempo_change',
+                 'commit_scrobble_jumps'):
+        assert instrumentation.counters(name)[0] > 0, name
+    del rig.c_instance.log[:]
+    rig.script.dump_instrumentation()
+    rig.tick()
+    logged = [line.split()[1] for line in rig.c_instance.log]
+    assert 'receive_midi' in logged and 'draw_mute_button' in logged
+    assert ['coarse_tempo_detents', '1'] in [
+        line.split()[1:] for line in rig.c_instance.log]
+    rig = harness.Rig.build(INSTRUMENTATION=True, SOFT_TAKEOVER=True)
+    rig.tracks[0].mixer_device.volume.value = 0.5
+    rig.cc(0x10, 0)
+    del rig.c_instance.log[:]
+    rig.script.dump_instrumentation()
+    rig.tick()
+    assert ['soft_takeover_ignored', '1'] in [
+        line.split()[1:] for line in rig.c_instance.log]
+
+
+def check_debug_print_buffers_levels_and_rate_limits():
+    import DebugPrint
+    c_instance = harness.FakeCInstance(None)
+    now = [0.0]
+    saved = DebugPrint._c_instance, DebugPrint._clock, DebugPrint._level
+    DebugPrint.set_c_instance(c_instance)
+    DebugPrint._clock = lambda: now[0]
+    try:
+        del c_instance.log[:]
+        DebugPrint.set_level(DebugPrint.INFO)
+        DebugPrint.debug('hidden %d', 1)
+        DebugPrint.info('value %d', 2)
+        for i in range(10):
+            DebugPrint.warning('repeated')
+        assert c_instance.log == [], 'logging must wait for the flush'
+        DebugPrint.flush()
+        assert c_instance.log == ['INFO: value 2', 'WARNING: repeated']
+        now[0] += DebugPrint.RATE_LIMIT_INTERVAL
+        DebugPrint.flush()
+        assert c_instance.log[-1] == 'Last message repeated 9 times: repeated'
+        del c_instance.log[:]
+        for i in range(DebugPrint.BUFFER_SIZE + 5):
+            DebugPrint.info('message %d' % i)
+        DebugPrint.flush()
+        assert c_instance.log[0] == 'WARNING: 5 log messages dropped'
+        assert c_instance.log[1] == 'INFO: message 5'
+        assert len(c_instance.log) == DebugPrint.BUFFER_SIZE + 1
+        # Repeats are told apart by their args, and any object can be logged
+        del c_instance.log[:]
+        DebugPrint.info('a %d', 2)
+        DebugPrint.info('a %d', 3)
+        DebugPrint.info('a %d', 3)
+        DebugPrint.info('b %s', [1])
+        DebugPrint.info('b %s', [2])
+        DebugPrint.log_message(['a', 1])
+
+        class Deleted(object):
+            def __repr__(self):
+                raise RuntimeError('object deleted')
+        DebugPrint.info('gone %r', Deleted())
+        DebugPrint.flush()
+        now[0] += DebugPrint.RATE_LIMIT_INTERVAL
+        DebugPrint.flush()
+        assert c_instance.log[:5] == [
+            'INFO: a 2', 'INFO: a 3', 'INFO: b [1]', "INFO: ['a', 1]",
+            'INFO: gone %r <args not printable>'], c_instance.log
+        assert sorted(c_instance.log[5:]) == [
+            '1 similar messages suppressed: b %s',
+            'Last message repeated 1 times: a 3'], c_instance.log
+        dump = DebugPrint.dump_object(c_instance)
+        assert '\nobj.rebuild_requests = 0' in dump
+    finally:
+        DebugPrint._c_instance, DebugPrint._clock, DebugPrint._level = saved
+        DebugPrint._last_logged.clear()
+
+
+def check_recorded_midi_replays_the_same():
+    import os
+    import tempfile
+    import MidiRecorder
+    import replay
+    handle, path = tempfile.mkstemp(suffix='.k2rec')
+    os.close(handle)
+    os.remove(path)
+    try:
+        outcomes = []
+        for run in range(2):
+            rig = harness.Rig.build(num_tracks=4, MIDI_RECORDING_PATH=path)
+            # The recorder and the tempo encoders share a fake clock, so
+            # the encoders are turned at known speeds
+            now = [0.0]
+            clock = lambda: now[0]
+            script = rig.script
+            script.midi_recorder._clock = clock
+            script.midi_recorder._last_time = now[0]
+            script.coarse_tempo_detents._clock = clock
+            script.fine_tempo_detents._clock = clock
+            rig.clear_counters()
+            for value in range(0, 128, 16):
+                rig.cc(0x10, value)
+                rig.cc(0x04, 127 - value)
+                rig.tick()
+            rig.press(0x1C)
+            rig.press(0x24)
+            rig.tick()
+            # Slow coarse detents, then a fast spin of the fine encoder
+            for cc, interval in [(0x14, 0.05)] * 10 + [(0x15, 0.015)] * 10:
+                now[0] += interval
+                rig.cc(cc, 1)
+            rig.tick()
+            rig.disconnect()
+            outcomes.append((rig.c_instance.sent_midi, rig.song.tempo))
+        assert outcomes[-1][1] == round(120.0 + 10 * 1.0 + 0.1 + 9 * 0.2, 2)
+        sessions = MidiRecorder.read_recording(path)
+        assert len(sessions) == 2, len(sessions)
+        events = sessions[-1]
+        assert len(events) == 8 * 3 + 4 + 1 + 20 + 1, len(events)
+        times = [seconds for seconds, _ in events]
+        assert times == sorted(times)
+        rig = harness.Rig.build(num_tracks=4)
+        rig.clear_counters()
+        replay.replay(rig, events)
+        rig.disconnect()
+        assert (rig.c_instance.sent_midi, rig.song.tempo) == outcomes[-1]
+        # Drops are reported with the instrumentation
+        rig = harness.Rig.build(MIDI_RECORDING_PATH=path, INSTRUMENTATION=True)
+        rig.script.midi_recorder.dropped_count = 3
+        del rig.c_instance.log[:]
+        rig.script.dump_instrumentation()
+        rig.disconnect()
+        assert any(line.split()[1:] == ['midi_records_dropped', '3']
+                   for line in rig.c_instance.log), rig.c_instance.log
+        assert any('dropped 3 records' in line for line in rig.c_instance.log)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    # An unwritable recording path only turns recording off
+    rig = harness.Rig.build(MIDI_RECORDING_PATH=os.path.join(path, 'x'))
+    assert rig.script.midi_recorder is None
+    rig.tick()
+    assert any('Not recording midi' in line for line in rig.c_instance.log)
+
+
+def check_units_control_their_own_track_slices():
+    import LedTable
+    for mode in ('table', 'elements'):
+        rig = harness.Rig.build(num_tracks=14, DISPATCH_MODE=mode,
+                                UNIT_MIDI_CHANNELS=(14, 13, 12))
+        # The first paint is spread over ticks in bursts the K2 can take
+        burst = rig.script.leds.max_sends
+        assert len(rig.c_instance.sent_midi) == burst
+        rig.settle()
+        assert len(rig.c_instance.sent_midi) == 3 * LedTable.NUM_LEDS
+        assert set(m[0] & 15 for m in rig.c_instance.sent_midi) == set(
+            [12, 13, 14])
+        rig.clear_counters()
+        rig.cc(0x10, 0, unit=2)
+        rig.note_on(0x1D, unit=1)
+        rig.tick()
+        volumes = [t.mixer_device.volume.value for t in rig.tracks]
+        assert volumes[8] != volumes[0] and volumes[0] == volumes[7]
+        assert [t.mute for t in rig.tracks[:12]] == [i == 5 for i in range(12)]
+        mute_off = (0x80 + 13, LedTable.NOTE_TO_MIDI['f1'], 127)
+        assert rig.c_instance.sent_midi == [mute_off], rig.c_instance.sent_midi
+        # Paging moves by all strips, the last bank leaves strips unbound
+        rig.note_on(0x0E, unit=2)
+        rig.cc(0x14, 1, unit=0)
+        assert rig.script.bank_offset == 12
+        assert rig.script.tracks[:2] == rig.tracks[12:]
+        assert rig.script.tracks[2:] == [None] * 10
+        rig.cc(0x10, 64, unit=2)
+        rig.press(0x1C, unit=2)
+        rig.tick()
+        rig.disconnect()
+
+
+def check_control_mapping_compiles_caches_and_remaps():
+    import os
+    import shutil
+    import tempfile
+    import ControlMapping
+    import XoneK2
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'mapping.txt')
+        cache_path = os.path.join(directory, 'mapping.cache')
+        with open(XoneK2.MAPPING_PATH) as original:
+            text = original.read()
+        # Swap the notes of the mute and cue buttons
+        text = text.replace('0x1C    mute', '0x24    mute').replace(
+            '0x24    cue ', '0x1C    cue ')
+        with open(path, 'w') as mapping_file:
+            mapping_file.write(text)
+        first = ControlMapping.load_mapping(path, cache_path)
+        assert os.path.exists(cache_path)
+        compile_mapping = ControlMapping.compile_mapping
+        def fail(*args):
+            raise AssertionError('an unchanged mapping was compiled again')
+        ControlMapping.compile_mapping = fail
+        try:
+            cached = ControlMapping.load_mapping(path, cache_path)
+        finally:
+            ControlMapping.compile_mapping = compile_mapping
+        assert cached.roles == first.roles
+        assert cached.numbers('mute') == (0x24, 0x1D, 0x1E, 0x1F)
+        rig = harness.Rig.build(num_tracks=4, MAPPING_PATH=path,
+                                MAPPING_CACHE_PATH=cache_path)
+        rig.press(0x24)
+        assert rig.tracks[0].mute and not rig.tracks[0].solo
+        rig.disconnect()
+        with open(cache_path, 'wb') as cache_file:
+            cache_file.write(b'garbage')
+        assert ControlMapping.load_mapping(path, cache_path).roles == (
+            first.roles)
+        for line, error in (('button 0x80 mute 0', 'out of range'),
+                            ('slider 0x10 volume 0', 'unknown kind'),
+                            ('button 0x1C mute 0 matrix_button_z red',
+                             'unknown LED')):
+            try:
+                ControlMapping.compile_mapping(line, 'test')
+            except ValueError as exception:
+                assert str(exception).startswith('test:1: '), exception
+                assert error in str(exception), exception
+            else:
+                raise AssertionError('%r compiled' % line)
+    finally:
+        shutil.rmtree(directory)
+
+
+def check_scrobble_jumps_are_accumulated_and_snapped():
+    for snap, expected in ((None, 18.0), ('beat', 19.0), ('bar', 20.0)):
+        rig = harness.Rig.build(num_tracks=4, SCROBBLE_SNAP=snap)
+        track = rig.tracks[1]
+        track.playing_slot_index = 2
+        clip = track.clip_slots[2].clip
+        clip.position = 0.5 if snap else 0.0
+        rig.clear_counters()
+        for _ in range(5):
+            rig.cc(0x01, 1)
+        rig.note_on(0x35)
+        rig.cc(0x01, 127)
+        rig.cc(0x01, 127)
+        rig.note_off(0x35)
+        rig.cc(0x00, 1) # the first track isn't playing
+        assert harness.fake_live.stats.live_writes == 0
+        rig.tick()
+        assert harness.fake_live.stats.live_writes == 1
+        assert clip.position == expected, (snap, clip.position)
+        # A jump pending when the clip stops is dropped
+        rig.cc(0x01, 1)
+        track.stop_all_clips()
+        rig.clear_counters()
+        rig.tick()
+        assert harness.fake_live.stats.live_writes == 0
+        rig.cc(0x01, 1)
+        assert rig.script.scrobble_offsets == {}
+
+
+def check_beat_feedback_animates_within_budget():
+    rig = harness.Rig.build(num_tracks=4, BEAT_LED_BUDGET=1,
+                            UNIT_MIDI_CHANNELS=(14, 13))
+    rig.settle()
+    script = rig.script
+    leds = script.leds
+    song = rig.song
+    rig.press(0x24)                      # cue the first track
+    rig.tracks[1].playing_slot_index = 0 # the second track plays a clip
+    rig.tick()
+    cue_led = script.cue_leds[0]
+    stop_led = script.track_stop_leds[1]
+    assert leds.is_lit(cue_led) and leds.is_lit(stop_led)
+    song.is_playing = True
+    song.current_song_time = 0.25
+    rig.tick()
+    assert leds.is_lit(cue_led) and leds.is_lit(stop_led)
+    # The second half of the beat dims both, one message per tick
+    rig.clear_counters()
+    song.current_song_time = 0.5
+    song.current_song_time = 0.75
+    rig.tick()
+    assert len(rig.c_instance.sent_midi) == 1
+    rig.tick()
+    assert len(rig.c_instance.sent_midi) == 2
+    assert not leds.is_lit(cue_led) and not leds.is_lit(stop_led)
+    rig.tick()
+    assert len(rig.c_instance.sent_midi) == 2
+    # Handlers are drawn right away whatever the budget
+    rig.clear_counters()
+    for note in (0x1C, 0x1D, 0x1E):
+        rig.press(note)
+    rig.tick()
+    assert len(rig.c_instance.sent_midi) == 3
+    # Stopping the clip stops its LED pulsing, uncueing stops the cue blink
+    rig.tracks[1].stop_all_clips()
+    rig.press(0x24)
+    song.current_song_time = 1.0
+    rig.tick()
+    rig.tick()
+    assert script.beat_frame == ()
+    assert not leds.is_lit(cue_led) and not leds.is_lit(stop_led)
+    # The nudge buttons of all units show the song's nudge state
+    rig.note_on(0x0F, unit=1)
+    rig.tick()
+    assert [leds.is_lit(led) for led in script.nudge_up_leds] == [True] * 2
+    rig.note_off(0x0F, unit=1)
+    rig.tick()
+    assert [leds.is_lit(led) for led in script.nudge_up_leds] == [False] * 2
+    rig.disconnect()
+
+
+def check_draws_and_toggles_read_the_cached_live_state():
+    rig = harness.Rig.build()
+    track = rig.tracks[1]
+    hi_on = [p for p in track.devices[0].parameters if p.name == 'HighOn'][0]
+    rig.clear_counters()
+    rig.script.resync(force_full_wipe=True)
+    assert harness.fake_live.stats.live_reads == 0
+    # A toggle writes from the cache, only the listener reads Live back
+    rig.press(0x1D)
+    rig.press(0x31)
+    assert harness.fake_live.stats.live_reads == 2
+    assert track.mute and hi_on.value == 0.0
+    rig.tick()
+    leds = rig.script.leds
+    assert not leds.is_lit(rig.script.mute_leds[1])
+    assert not leds.is_lit(rig.script.hi_eq_cut_leds[1])
+    # Changes made in Live reach the cache through the listeners
+    track.mute = False
+    hi_on.value = 1.0
+    track.solo = True
+    rig.clear_counters()
+    rig.script.resync()
+    assert leds.is_lit(rig.script.mute_leds[1])
+    assert leds.is_lit(rig.script.hi_eq_cut_leds[1])
+    assert leds.is_lit(rig.script.cue_leds[1])
+    assert harness.fake_live.stats.live_reads == 0
+
+
+def check_noop_writes_are_skipped_and_soft_takeover_picks_up():
+    rig = harness.Rig.build()
+    gain_hi = rig.tracks[0].devices[0].parameters[3]
+    dead_zone = [value for value in range(128)
+                 if rig.script.eq_curve[value] == NORMALIZED_ZERO_DB]
+    assert len(dead_zone) > 2, dead_zone
+    rig.clear_counters()
+    for value in dead_zone:
+        rig.cc(0x04, value)
+        rig.tick()
+    assert harness.fake_live.stats.live_writes == 1
+    assert gain_hi.value == NORMALIZED_ZERO_DB
+
+    rig = harness.Rig.build(SOFT_TAKEOVER=True)
+    volume = rig.tracks[0].mixer_device.volume
+    volume.value = reference_volume_fader_value(64)
+    rig.clear_counters()
+    for value in (0, 10, 40):
+        rig.cc(0x10, value)
+    rig.tick()
+    assert harness.fake_live.stats.live_writes == 0
+    assert volume.value == reference_volume_fader_value(64)
+    rig.cc(0x10, 120) # crosses the volume of the track
+    rig.cc(0x10, 110)
+    rig.tick()
+    assert volume.value == reference_volume_fader_value(110), volume.value
+    # A newly bound EQ3 waits for the knob again
+    track = rig.tracks[0]
+    track.delete_device(0)
+    track.insert_device(harness.fake_live.make_eq_three())
+    gain_hi = track.devices[0].parameters[3]
+    rig.clear_counters()
+    rig.cc(0x04, 127)
+    rig.tick()
+    assert harness.fake_live.stats.live_writes == 0
+    rig.cc(0x04, 0)
+    rig.tick()
+    assert gain_hi.value == rig.script.eq_curve[0]
+    # An EQ Eight gain above the +6 dB the curve reaches is picked up there
+    eq8 = harness.fake_live.make_eq_eight()
+    track.insert_device(eq8, 0)
+    track.delete_device(1)
+    gain_8 = [p for p in eq8.parameters if p.name == '8 Gain A'][0]
+    gain_8.value = 10.0
+    rig.cc(0x04, 100)
+    rig.tick()
+    assert gain_8.value == 10.0
+    rig.cc(0x04, 127)
+    rig.tick()
+    assert gain_8.value == 6.0, gain_8.value
+    rig.cc(0x04, 90)
+    rig.tick()
+    assert gain_8.value == rig.script.eq_gain_curves[0][90], gain_8.value
+    # The range of every curve is found once, alternating controls too
+    soft_takeover = rig.script.soft_takeover
+    curves = set(id(curve) for curve in (
+        rig.script.volume_curve, rig.script.eq_curve,
+        rig.script.eq_gain_curves[0]))
+    assert set(soft_takeover._curve_ranges) == curves
+
+
+def check_eq_devices_are_bound_by_profile():
+    fake_live = harness.fake_live
+    rig = harness.Rig.build(with_eq3=False)
+    script = rig.script
+    # A renamed EQ Three is still an EQ Three
+    track = rig.tracks[0]
+    track.insert_device(fake_live.make_eq_three('My EQ'))
+    assert script.eq_devices[0] is track.devices[0]
+    # EQ Eight drives the gains of its top, middle and bottom bands, scaled
+    track = rig.tracks[1]
+    eq8 = fake_live.make_eq_eight()
+    track.insert_device(fake_live.make_filler_device())
+    track.insert_device(eq8)
+    params = dict((param.name, param) for param in eq8.parameters)
+    assert script.eq_devices[1] is eq8
+    rig.cc(0x05, 127)
+    rig.cc(0x09, 64)
+    rig.tick()
+    assert params['8 Gain A'].value == 6.0, params['8 Gain A'].value
+    assert params['4 Gain A'].value == 0.0, params['4 Gain A'].value
+    # Its band filters only make a band flat, so they aren't cuts
+    rig.press(0x31)
+    assert params['8 Filter On A'].value == 1.0
+    assert not script.leds.is_lit(script.hi_eq_cut_leds[1])
+    # An EQ Three before or after it is preferred
+    eq3 = fake_live.make_eq_three()
+    track.insert_device(eq3)
+    assert script.eq_devices[1] is eq3
+    track.delete_device(2)
+    track.insert_device(fake_live.make_eq_eight(), 0)
+    assert script.eq_devices[1] is not eq3
+    # Only racks with High, Mid and Low macros match, without band cuts
+    track = rig.tracks[2]
+    track.insert_device(fake_live.make_rack())
+    assert script.eq_devices[2] is None
+    rack = fake_live.make_rack('DJ Filter', ('High', 'Mid', 'Low'))
+    track.insert_device(rack)
+    assert script.eq_devices[2] is rack
+    rig.cc(0x0E, 127)
+    rig.tick()
+    assert rack.parameters[3].value == 127.0, rack.parameters[3].value
+    rig.press(0x2A)
+    assert not script.leds.is_lit(script.low_eq_cut_leds[2])
+    # New curves are scaled too
+    script.set_response_curves(eq_curve=[0.0] * 128)
+    rig.cc(0x0E, 5)
+    rig.tick()
+    assert rack.parameters[3].value == 0.0
+    # The layout of a matching rack is cached, even after a plain one
+    import DeviceProfiles
+    DeviceProfiles._parameter_indexes.clear()
+    plain = fake_live.make_rack()
+    assert DeviceProfiles.find_eq_device([plain]) == (None, None, None)
+    assert DeviceProfiles.find_eq_device([rack])[0] is rack
+    DeviceProfiles.find_eq_device([plain])
+    indexes = DeviceProfiles._parameter_indexes['AudioEffectGroupDevice']
+    assert indexes['High'] == 1, indexes
+
+
+def check_midi_storms_keep_the_invariants():
+    import stress
+    for seed in range(3):
+        stress.stress(seed, 2000, budget_us=None)
+    stress.stress(3, 2000, num_tracks=2, budget_us=None,
+                  settings={'UNIT_MIDI_CHANNELS': (14, 13)})
+    for seed in range(2):
+        stress.stress(seed, 2000, budget_us=None,
+                      settings={'LED_QUEUE_SIZE': 8})
+
+
+def check_led_scheduler_orders_merges_and_bounds():
+    from LedFramebuffer import COSMETIC, FEEDBACK, STATE, LedFramebuffer
+    sent = []
+    on = tuple(('on', led) for led in range(10))
+    off = tuple(('off', led) for led in range(10))
+    leds = LedFramebuffer(sent.append, on, off, max_sends=3, max_pending=4)
+    leds.set_lit(0, True, COSMETIC)
+    leds.set_lit(5, True, STATE)
+    leds.set_lit(9, True, FEEDBACK)
+    leds.set_lit(5, False, FEEDBACK) # merged, and now more urgent
+    leds.set_lit(9, False, COSMETIC) # merged, keeps its urgency
+    leds.set_lit(2, True, STATE)
+    assert leds.pending_count == 4 and leds.merged_count == 2
+    leds.set_lit(3, True, STATE)     # full: drops the cosmetic change
+    leds.set_lit(4, True, COSMETIC)  # full of more urgent changes: dropped
+    assert leds.dropped_count == 2 and leds.is_lit(0) is None
+    assert leds.flush() == 3
+    assert sent == [('off', 5), ('off', 9), ('on', 2)], sent
+    assert leds.pending_count == 1 and leds.is_lit(3)
+    assert leds.flush() == 1 and sent[-1] == ('on', 3)
+    leds.set_lit(3, True, FEEDBACK)  # already shown, needs no message
+    assert leds.flush() == 0
+    # the two merged changes and the change that was already shown
+    assert leds.skipped_count == 3, leds.skipped_count
+    # State changes that find no room wait, and are never dropped
+    for led in range(8):
+        leds.set_lit(led, False, STATE)
+    assert leds.dropped_count == 2 and leds.overflowed_count == 4
+    assert leds.pending_count == 8 and leds.is_lit(7) is False
+    leds.flush(None)
+    assert leds.pending_count == 0
+    assert [leds.is_lit(led) for led in range(8)] == [False] * 8
+
+
+def check_small_led_queue_still_paints_everything():
+    full = harness.Rig.build()
+    rig = harness.Rig.build(LED_QUEUE_SIZE=32)
+    for _ in range(10):
+        rig.tick()
+    leds = rig.script.leds
+    assert leds.pending_count == 0 and leds.dropped_count == 0
+    states = [leds.is_lit(led) for led in range(rig.script.num_leds)]
+    assert states == [full.script.leds.is_lit(led)
+                      for led in range(full.script.num_leds)]
+    assert None not in states
+
+
+def main():
+    checks = [(name, function) for name, function in globals().items()
+              if name.startswith('check_')]
+    failures = 0
+    checks.sort(key=lambda check: check[1].__code__.co_firstlineno)
+    for name, check in checks:
+        try:
+            check()
+        except Exception:
+            failures += 1
+            print('FAIL %s' % name)
+            traceback.print_exc()
+        else:
+            print('ok   %s' % name)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
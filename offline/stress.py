@@ -0,0 +1,423 @@
+"""
+Randomized midi storm stress test of the Xone K2 remote script, run offline.
+
+Every seed builds a fake song with a random number of tracks, zero to
+eight, and fires a random mix of the notes and CCs of the control mapping
+at the script, interleaved with mute, solo, clip, switch, device list and
+track list changes made on the Live side. Time is virtual and every choice
+comes from a random generator seeded by the seed, so a failing seed fails
+the same way every time it is run again.
+
+At quiet points, every few ticks, the held buttons are released, the LED
+queue is drained and the invariants are checked:
+
+    the LEDs of the controller, as rebuilt from the sent midi, match Live
+    every strip is bound to its track of the bank and its best EQ device
+    the listeners connected to Live are exactly those of the bindings
+
+Any exception fails the seed, and so does a midi message handled slower
+than the latency budget, in CPU time. The garbage collector is off while a
+seed runs, so its pauses don't count against the budget either.
+
+    python offline/stress.py                           # seeds 0 to 9
+    python offline/stress.py --seed 1234 --events 50000
+    python offline/stress.py --seed 7 --set SOFT_TAKEOVER=True
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import random
+import sys
+import time
+import traceback
+
+import fake_live
+import harness
+from harness import CC
+from harness import NOTE_OFF
+from harness import NOTE_ON
+from harness import Rig
+from DeviceProfiles import find_eq_device
+from LedTable import build_led_messages
+
+# CPU time of the process, so that other load on the machine running the
+# storm doesn't count against the latency budget
+timer = getattr(time, 'process_time', None) or time.clock
+
+MAX_TRACKS = 8
+LATENCY_BUDGET_US = 2000.0
+# Virtual time between events and between display ticks, in seconds
+MIN_EVENT_INTERVAL = 0.0005
+MAX_EVENT_INTERVAL = 0.01
+TICK_INTERVAL = 0.1
+CHECK_EVERY_TICKS = 8
+LIVE_EVENT_RATIO = 0.1
+STRAY_MIDI_RATIO = 0.02
+RELATIVE_ROLES = ('coarse_tempo', 'fine_tempo', 'scrobble')
+# devices, mute, solo and playing_slot_index of every bound track
+TRACK_LISTENERS = 4
+
+DEVICE_FACTORIES = (
+    fake_live.make_eq_three,
+    fake_live.make_eq_eight,
+    lambda: fake_live.make_rack('DJ Filter', ('High', 'Mid', 'Low')),
+    fake_live.make_rack,
+    fake_live.make_filler_device,
+)
+
+
+class StressFailure(AssertionError):
+    """ An invariant broke, or the script raised, during a storm. """
+
+
+def controller_messages(script):
+    """
+    Returns the (status, number, values) of every control of every unit in
+    the control mapping, where values are the ones the control can send.
+    """
+    messages = []
+    mapping = script.mapping
+    for role in sorted(mapping.roles):
+        kind = mapping.kind(role)
+        for channel in script.unit_channels:
+            for number in mapping.numbers(role):
+                if kind == 'button':
+                    messages.append((NOTE_ON + channel, number, (127,)))
+                    messages.append((NOTE_OFF + channel, number, (0,)))
+                elif role in RELATIVE_ROLES:
+                    messages.append((CC + channel, number, (1, 127)))
+                else:
+                    messages.append((CC + channel, number, range(128)))
+    return messages
+
+
+def random_track(rng, name):
+    """ Create a fake track with a random chain of devices. """
+    track = fake_live.Track(name)
+    devices = [rng.choice(DEVICE_FACTORIES)()
+               for _ in range(rng.randint(0, 3))]
+    object.__setattr__(track, 'devices', devices)
+    return track
+
+
+class Storm(object):
+    """
+    A script instance on a fake song, and the random events fired at it.
+
+    seed:       seed of the random generator driving the storm
+    num_tracks: tracks of the song, or None for a random number
+    settings:   XoneK2.py settings to override, as for Rig.build
+    """
+    def __init__(self, seed, num_tracks=None, settings={}):
+        self.rng = rng = random.Random(seed)
+        if num_tracks is None:
+            num_tracks = rng.randint(0, MAX_TRACKS)
+        self.track_count = num_tracks
+        tracks = [random_track(rng, '%d Audio' % (i + 1))
+                  for i in range(num_tracks)]
+        self.now = 0.0
+        self.next_tick = TICK_INTERVAL
+        clock = lambda: self.now
+        self.rig = Rig.build(song=fake_live.Song(tracks), **settings)
+        script = self.rig.script
+        for accumulator in (script.coarse_tempo_detents,
+                            script.fine_tempo_detents):
+            accumulator._clock = clock
+        self.song = self.rig.song
+        self.all_tracks = list(tracks)
+        self.all_devices = [d for t in tracks for d in t.devices]
+        self.song_listener_count = self.song.listener_count()
+        self.messages = controller_messages(script)
+        self.held = {}
+        self.led_states = {}
+        self.sent_seen = 0
+        self.led_messages = {}
+        for unit, channel in enumerate(script.unit_channels):
+            on_messages, off_messages = build_led_messages(channel)
+            for led_index, message in enumerate(on_messages):
+                self.led_messages[message] = (
+                    unit * len(on_messages) + led_index, True)
+            for led_index, message in enumerate(off_messages):
+                self.led_messages[message] = (
+                    unit * len(off_messages) + led_index, False)
+        self.midi_latencies = []
+        self.live_latencies = []
+        self.event_count = 0
+        self.check_count = 0
+        self.min_visible = self.max_visible = num_tracks
+
+    def run(self, num_events):
+        """ Fire num_events random events, checking as it goes. """
+        rng = self.rng
+        for _ in range(num_events):
+            self.event_count += 1
+            self.now += rng.uniform(MIN_EVENT_INTERVAL, MAX_EVENT_INTERVAL)
+            if self.now >= self.next_tick:
+                self.next_tick += TICK_INTERVAL
+                self.rig.tick()
+                if self.rig.ticks % CHECK_EVERY_TICKS == 0:
+                    self.check_invariants()
+            roll = rng.random()
+            if roll < LIVE_EVENT_RATIO:
+                self.live_event()
+            elif roll < LIVE_EVENT_RATIO + STRAY_MIDI_RATIO:
+                self.send((rng.randrange(0x80, 0xF0), rng.randrange(128),
+                           rng.randrange(128)))
+            else:
+                status, number, values = rng.choice(self.messages)
+                self.send((status, number, rng.choice(values)))
+        self.check_invariants()
+        self.rig.disconnect()
+        remaining = self.count_listeners()
+        if remaining:
+            raise StressFailure('%d listeners left after disconnect'
+                                % remaining)
+
+    def send(self, midi_bytes):
+        """ Send a message to the script, timing it and tracking holds. """
+        status, number, value = midi_bytes
+        if status & 0xF0 == NOTE_ON and value:
+            self.held[(status & 0x0F, number)] = True
+        elif status & 0xF0 in (NOTE_ON, NOTE_OFF):
+            self.held.pop((status & 0x0F, number), None)
+        start = timer()
+        self.rig.script.receive_midi(midi_bytes)
+        self.midi_latencies.append(timer() - start)
+
+    def live_event(self):
+        """ Change the song the way a user working in Live would. """
+        rng = self.rng
+        tracks = self.song.visible_tracks
+        action = rng.randrange(8)
+        if action == 0 or not tracks:
+            self.change_track_list()
+            return
+        track = rng.choice(tracks)
+        start = timer()
+        if action == 1:
+            track.mute = not track.mute
+        elif action == 2:
+            track.solo = not track.solo
+        elif action == 3:
+            track.playing_slot_index = rng.randrange(-1,
+                                                     len(track.clip_slots))
+        elif action == 4:
+            device = rng.choice(DEVICE_FACTORIES)()
+            self.all_devices.append(device)
+            track.insert_device(device, rng.randint(0, len(track.devices)))
+        elif action == 5 and track.devices:
+            track.delete_device(rng.randrange(len(track.devices)))
+        elif track.devices:
+            device = rng.choice(track.devices)
+            switches = [param for param in device.parameters
+                        if param.name.endswith(('On', 'On A'))]
+            rng.choice(switches).value = rng.choice((0.0, 1.0))
+        self.live_latencies.append(timer() - start)
+
+    def change_track_list(self):
+        """ Add, remove or move a track of the song. """
+        rng = self.rng
+        tracks = list(self.song.visible_tracks)
+        action = rng.randrange(3)
+        if (action == 0 or not tracks) and len(tracks) < MAX_TRACKS:
+            self.track_count += 1
+            track = random_track(rng, '%d Audio' % self.track_count)
+            self.all_tracks.append(track)
+            self.all_devices.extend(track.devices)
+            tracks.insert(rng.randint(0, len(tracks)), track)
+        elif action == 1 and tracks:
+            del tracks[rng.randrange(len(tracks))]
+        elif tracks:
+            tracks.insert(rng.randint(0, len(tracks) - 1),
+                          tracks.pop(rng.randrange(len(tracks))))
+        start = timer()
+        self.song.tracks = tracks
+        self.song.visible_tracks = tracks
+        self.live_latencies.append(timer() - start)
+        self.min_visible = min(self.min_visible, len(tracks))
+        self.max_visible = max(self.max_visible, len(tracks))
+
+    def release_held_buttons(self):
+        """ Let go of every button held down, like a user eventually does. """
+        for channel, number in sorted(self.held):
+            self.send((NOTE_OFF + channel, number, 0))
+
+    def update_led_states(self):
+        """ Apply the midi sent since the last update to the K2's LEDs. """
+        sent_midi = self.rig.c_instance.sent_midi
+        for midi_bytes in sent_midi[self.sent_seen:]:
+            led_state = self.led_messages.get(tuple(midi_bytes))
+            if led_state is None:
+                raise StressFailure('sent a message that is not an LED '
+                                    'change: %r' % (midi_bytes,))
+            led, lit = led_state
+            self.led_states[led] = lit
+        self.sent_seen = len(sent_midi)
+
+    def expected_led_states(self):
+        """ Returns the state every LED should have, from the Live state. """
+        script = self.rig.script
+        expected = dict((led, False) for led in range(script.num_leds))
+        visible_tracks = self.song.visible_tracks
+        for i in range(script.num_strips):
+            track_index = script.bank_offset + i
+            if track_index >= len(visible_tracks):
+                continue
+            track = visible_tracks[track_index]
+            expected[script.mute_leds[i]] = not track.mute
+            expected[script.cue_leds[i]] = track.solo
+            expected[script.track_stop_leds[i]] = (
+                script.beat_feedback and track.playing_slot_index > -1)
+            _, _, parameters = find_eq_device(track.devices)
+            if parameters is None:
+                continue
+            for param, leds in zip(parameters[:4], (
+                    script.eq_kill_leds, script.hi_eq_cut_leds,
+                    script.mid_eq_cut_leds, script.low_eq_cut_leds)):
+                expected[leds[i]] = param is not None and param.value == 1.0
+        for unit in range(script.num_units):
+            expected[script.nudge_up_leds[unit]] = self.song.nudge_up
+            expected[script.nudge_back_leds[unit]] = self.song.nudge_down
+        return expected
+
+    def count_listeners(self):
+        """ Count the listeners on every Live object the storm created. """
+        objects = [self.song]
+        for track in self.all_tracks:
+            objects += [track, track.mixer_device, track.mixer_device.volume]
+            objects += track.clip_slots
+            objects += [slot.clip for slot in track.clip_slots if slot.clip]
+        for device in self.all_devices:
+            objects.append(device)
+            objects += device.parameters
+        return sum(o.listener_count() for o in objects)
+
+    def check_invariants(self):
+        """ Bring the script to a quiet point and compare it with Live. """
+        self.check_count += 1
+        script = self.rig.script
+        self.release_held_buttons()
+        for _ in range(script.num_leds):
+            self.rig.tick()
+            if not script.leds.pending_count:
+                break
+        else:
+            raise StressFailure('the LED queue does not drain')
+        self.update_led_states()
+        expected = self.expected_led_states()
+        wrong = sorted(led for led, lit in expected.items()
+                       if self.led_states.get(led) is not lit)
+        if wrong:
+            raise StressFailure('LEDs %r differ from the Live state' % wrong)
+        visible_tracks = self.song.visible_tracks
+        expected_listeners = self.song_listener_count
+        for i in range(script.num_strips):
+            track_index = script.bank_offset + i
+            track = None
+            if track_index < len(visible_tracks):
+                track = visible_tracks[track_index]
+            if script.tracks[i] is not track:
+                raise StressFailure('strip %d is bound to the wrong track'
+                                    % i)
+            if track is None:
+                continue
+            device, _, parameters = find_eq_device(track.devices)
+            if script.eq_devices[i] is not device:
+                raise StressFailure('strip %d is bound to the wrong EQ '
+                                    'device' % i)
+            expected_listeners += TRACK_LISTENERS
+            if parameters is not None:
+                expected_listeners += sum(1 for param in parameters[:4]
+                                          if param is not None)
+        listener_count = self.count_listeners()
+        if listener_count != expected_listeners:
+            raise StressFailure('%d listeners connected to Live, expected %d'
+                                % (listener_count, expected_listeners))
+
+
+def percentile(samples, fraction):
+    """ Returns the sample at a fraction of the sorted samples. """
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def stress(seed, num_events, num_tracks=None, budget_us=LATENCY_BUDGET_US,
+           settings={}):
+    """
+    Run the storm of a seed, raising StressFailure if it fails.
+
+    budget_us: latency budget per midi message in microseconds, or None to
+               not check latencies
+    Returns the Storm that ran.
+    """
+    # Like timeit, keep the garbage collector from pausing the messages
+    gc_was_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    storm = Storm(seed, num_tracks, settings)
+    try:
+        storm.run(num_events)
+    except StressFailure as failure:
+        raise StressFailure('seed %d, event %d: %s'
+                            % (seed, storm.event_count, failure))
+    except Exception:
+        raise StressFailure('seed %d, event %d: the script raised\n%s'
+                            % (seed, storm.event_count,
+                               traceback.format_exc()))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    worst = max(storm.midi_latencies) * 1e6 if storm.midi_latencies else 0.0
+    if budget_us is not None and worst > budget_us:
+        raise StressFailure('seed %d: a midi message took %.0f us, over the '
+                            'budget of %.0f us' % (seed, worst, budget_us))
+    return storm
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seed', type=int, action='append',
+                        help='seed to run, may be repeated; default 0 to 9')
+    parser.add_argument('--events', type=int, default=20000,
+                        help='events per seed')
+    parser.add_argument('--tracks', type=int, default=None,
+                        help='tracks of the song, default random per seed')
+    parser.add_argument('--budget-us', type=float, default=LATENCY_BUDGET_US,
+                        help='latency budget per midi message, 0 to not '
+                             'check latencies')
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='override a XoneK2.py setting, '
+                             'e.g. --set SOFT_TAKEOVER=True')
+    args = parser.parse_args(argv)
+    seeds = args.seed if args.seed is not None else range(10)
+    settings = harness.parse_settings(args.set)
+    budget_us = args.budget_us or None
+    failures = 0
+    for seed in seeds:
+        try:
+            storm = stress(seed, args.events, args.tracks, budget_us,
+                           settings)
+        except StressFailure as failure:
+            failures += 1
+            print('FAIL %s' % failure)
+            print('  rerun with: python offline/stress.py --seed %d '
+                  '--events %d%s' % (seed, args.events, ''.join(
+                      ' --set %s' % assignment for assignment in args.set)))
+            continue
+        midi_us = [latency * 1e6 for latency in storm.midi_latencies]
+        live_us = [latency * 1e6 for latency in storm.live_latencies]
+        print('ok seed %d: %d events, %d to %d tracks, %d ticks, %d checks; '
+              'midi p99 %.0f us max %.0f us, live max %.0f us'
+              % (seed, storm.event_count, storm.min_visible,
+                 storm.max_visible, storm.rig.ticks, storm.check_count,
+                 percentile(midi_us, 0.99), max(midi_us or [0.0]),
+                 max(live_us or [0.0])))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
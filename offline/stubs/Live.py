@@ -0,0 +1,21 @@
+"""
+Offline stand-in for the parts of Live's embedded `Live` module used by the
+script. Only what XoneK2.py touches at import or construction time is here.
+"""
+
+
+class MidiMap(object):
+
+    class MapMode(object):
+        absolute = 0
+        relative_signed_bit = 1
+        relative_binary_offset = 2
+        relative_two_compliment = 3
+
+    @staticmethod
+    def forward_midi_cc(script_handle, midi_map_handle, channel, cc):
+        return True
+
+    @staticmethod
+    def forward_midi_note(script_handle, midi_map_handle, channel, note):
+        return True
@@ -0,0 +1,14 @@
+from _Framework.InputControlElement import InputControlElement
+
+
+class ButtonElement(InputControlElement):
+
+    def __init__(self, is_momentary, msg_type, channel, identifier, *a, **k):
+        super(ButtonElement, self).__init__(msg_type, channel, identifier)
+        self._is_momentary = bool(is_momentary)
+
+    def is_momentary(self):
+        return self._is_momentary
+
+    def is_pressed(self):
+        return False
@@ -0,0 +1,88 @@
+"""
+Offline stand-in for _Framework.ControlSurface.
+
+MIDI is routed the way the real framework does it: controls register while
+component_guard is active, and receive_midi looks the sender up by its
+(status, identifier) key before calling InputControlElement.receive_value.
+"""
+from contextlib import contextmanager
+
+from _Framework import InputControlElement as ice
+
+
+class ControlSurface(object):
+
+    def __init__(self, c_instance, publish_self=True, *a, **k):
+        self._c_instance = c_instance
+        self._forwarding_registry = {}
+        self._suppress_rebuild_requests = False
+        self.controls = []
+
+    @contextmanager
+    def component_guard(self):
+        previous = ice._registering_surface[0]
+        ice._registering_surface[0] = self
+        try:
+            yield
+        finally:
+            ice._registering_surface[0] = previous
+
+    def _set_suppress_rebuild_requests(self, suppress_requests):
+        self._suppress_rebuild_requests = suppress_requests
+
+    def _register_control(self, control):
+        self.controls.append(control)
+        key = (control.status_byte(), control.message_identifier())
+        self._forwarding_registry[key] = control
+
+    def song(self):
+        return self._c_instance.song()
+
+    def application(self):
+        return None
+
+    def log_message(self, *message):
+        self._c_instance.log_message(' '.join(map(str, message)))
+
+    def show_message(self, message):
+        self._c_instance.show_message(message)
+
+    def request_rebuild_midi_map(self):
+        self._c_instance.request_rebuild_midi_map()
+
+    def build_midi_map(self, midi_map_handle):
+        pass
+
+    def receive_midi(self, midi_bytes):
+        status = midi_bytes[0]
+        value = midi_bytes[2]
+        if status & 240 == ice.MIDI_NOTE_OFF_STATUS:
+            status = ice.MIDI_NOTE_ON_STATUS + (status & 15)
+            value = 0
+        recipient = self._forwarding_registry.get((status, midi_bytes[1]))
+        if recipient is not None:
+            recipient.receive_value(value)
+
+    def update_display(self):
+        pass
+
+    def refresh_state(self):
+        pass
+
+    def connect_script_instances(self, instanciated_scripts):
+        pass
+
+    def can_lock_to_devices(self):
+        return False
+
+    def suggest_input_port(self):
+        return ''
+
+    def suggest_output_port(self):
+        return ''
+
+    def disconnect(self):
+        for control in self.controls:
+            control.disconnect()
+        self.controls = []
+        self._forwarding_registry = {}
@@ -0,0 +1,11 @@
+from _Framework.InputControlElement import InputControlElement
+
+
+class EncoderElement(InputControlElement):
+
+    def __init__(self, msg_type, channel, identifier, map_mode, *a, **k):
+        super(EncoderElement, self).__init__(msg_type, channel, identifier)
+        self._map_mode = map_mode
+
+    def message_map_mode(self):
+        return self._map_mode
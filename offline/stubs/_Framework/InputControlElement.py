@@ -0,0 +1,68 @@
+"""
+Offline stand-in for _Framework.InputControlElement.
+
+Elements created inside ControlSurface.component_guard register themselves
+with that surface, which is how the real framework installs MIDI forwarding.
+"""
+MIDI_NOTE_TYPE = 0
+MIDI_CC_TYPE = 1
+MIDI_PB_TYPE = 2
+MIDI_SYSEX_TYPE = 3
+MIDI_INVALID_TYPE = 4
+MIDI_NOTE_ON_STATUS = 144
+MIDI_NOTE_OFF_STATUS = 128
+MIDI_CC_STATUS = 176
+MIDI_PB_STATUS = 224
+
+_STATUS_FOR_TYPE = {
+    MIDI_NOTE_TYPE: MIDI_NOTE_ON_STATUS,
+    MIDI_CC_TYPE: MIDI_CC_STATUS,
+    MIDI_PB_TYPE: MIDI_PB_STATUS,
+}
+
+# Surface whose component_guard is currently active, see ControlSurface.
+_registering_surface = [None]
+
+
+class InputControlElement(object):
+
+    def __init__(self, msg_type, channel, identifier, *a, **k):
+        self._msg_type = msg_type
+        self._original_channel = channel
+        self._original_identifier = identifier
+        self._value_listeners = []
+        self._last_sent_value = -1
+        self.name = ''
+        surface = _registering_surface[0]
+        if surface is not None:
+            surface._register_control(self)
+
+    def message_type(self):
+        return self._msg_type
+
+    def message_channel(self):
+        return self._original_channel
+
+    def message_identifier(self):
+        return self._original_identifier
+
+    def status_byte(self):
+        return _STATUS_FOR_TYPE[self._msg_type] + self._original_channel
+
+    def add_value_listener(self, listener, identify_sender=False):
+        if listener in self._value_listeners:
+            raise RuntimeError('Listener already connected')
+        self._value_listeners.append(listener)
+
+    def remove_value_listener(self, listener):
+        self._value_listeners.remove(listener)
+
+    def value_has_listener(self, listener):
+        return listener in self._value_listeners
+
+    def receive_value(self, value):
+        for listener in list(self._value_listeners):
+            listener(value)
+
+    def disconnect(self):
+        self._value_listeners = []
@@ -0,0 +1,5 @@
+from _Framework.InputControlElement import InputControlElement
+
+
+class SliderElement(InputControlElement):
+    pass
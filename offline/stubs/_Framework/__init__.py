@@ -0,0 +1,3 @@
+"""
+Offline stand-in for the subset of Live's _Framework package used by XoneK2.
+"""